@@ -0,0 +1,72 @@
+import queue
+import threading
+
+import telemetry
+
+# output of a run on a background thread. submit() queues a function with its arguments and returns at once,
+# unless max_queued items are already waiting: then it blocks until the thread has caught up, so a slow disk
+# throttles the simulation only when it falls behind by a whole queue and memory stays bounded. The arguments
+# must not change after submit, pass copies of the state. Leaving the with block, also through an exception,
+# writes everything that is still queued. An error of the thread is raised by the next submit, flush or close.
+
+
+class AsyncWriter:
+
+    def __init__(self, max_queued=8, background=True):
+        self.background = background
+        self.error = None
+        if background:
+            self.queue = queue.Queue(max_queued)
+            self.thread = threading.Thread(target=self.run, daemon=True)
+            self.thread.start()
+
+    def run(self):
+        while True:
+            item = self.queue.get()
+            try:
+                if item is None:
+                    return
+                if self.error is None:  # after a failure the rest of the queue is dropped
+                    function, args, kwargs = item
+                    function(*args, **kwargs)
+            except BaseException as error:
+                self.error = error
+            finally:
+                self.queue.task_done()
+
+    def check(self):
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise RuntimeError('Writing the output in the background failed') from error
+
+    def submit(self, function, *args, **kwargs):
+        self.check()
+        if not self.background:
+            function(*args, **kwargs)
+            return
+        if telemetry.enabled and self.queue.full():
+            telemetry.count('output_queue_full')
+        self.queue.put((function, args, kwargs))
+
+    def flush(self):
+        # waits until everything submitted so far is written
+        if self.background:
+            self.queue.join()
+        self.check()
+
+    def close(self):
+        if self.background and self.thread.is_alive():
+            self.queue.put(None)
+            self.thread.join()
+        self.check()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            self.close()
+        except RuntimeError:
+            if exc_type is None:
+                raise
+            # the exception that ended the run is the one to report
@@ -0,0 +1,287 @@
+import argparse
+import contextlib
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time as timer
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import coarse_grained
+import cu_thin_film
+import sparse_kmc
+from jump_site_set import JumpSiteSet
+from rng import seed_stream
+
+# events per second, setup time and memory of both engines over a range of lattice sizes and box counts.
+# Every case runs in a fresh process, so its peak RSS is not inflated by the cases before it. The engines run at
+# the constant temperature of the case until an event or wall time budget is used up. They do not report how
+# many exchanges a step made, the benchmark counts them where they happen (make_jumps, make_leap).
+
+thin_film_modes = ['step', 'rejection_free']
+coarse_modes = ['kmc', 'tau_leap']
+
+
+def get_peak_rss():
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak_rss if sys.platform == 'darwin' else peak_rss * 1024
+
+
+def get_state_bytes(*states):
+    # bytes held by the numpy arrays of the simulation state
+    state_bytes = 0
+    for state in states:
+        if isinstance(state, dict):
+            state_bytes += get_state_bytes(*state.values())
+        elif isinstance(state, JumpSiteSet):
+            state_bytes += state.sites.nbytes + state.position.nbytes
+        elif isinstance(state, np.ndarray):
+            state_bytes += state.nbytes
+    return state_bytes
+
+
+@contextlib.contextmanager
+def count_events(module, name, get_count):
+    # wraps module.name for the duration of the block, counter[0] is the number of events it made
+    function = getattr(module, name)
+    counter = [0]
+
+    def counted(*args, **kwargs):
+        result = function(*args, **kwargs)
+        counter[0] += get_count(args, result)
+        return result
+
+    setattr(module, name, counted)
+    try:
+        yield counter
+    finally:
+        setattr(module, name, function)
+
+
+def run_thin_film_case(case):
+    cu_thin_film.jump_backend = case['backend']
+    # equal start and end temperature keep the ramp flat, the huge total time lets kmc_sim accept every step.
+    # A float like the temperatures the steps return, numba compiles the kernels once per argument types
+    temperature = float(case['temperature'])
+    cu_thin_film.initial_temperature = temperature
+    total_time = 1e300
+    shape = (int(case['cu_thickness'] / cu_thin_film.distance), case['grid_dim_x'])
+    # compile the kernels before the clock starts, with the argument types of the timed loop
+    cu_thin_film.make_jumps(*cu_thin_film.get_atom_jump_site_matrix(cu_thin_film.generate_cu_al_grid(0.5, (8, 4))), 1)
+    cu_thin_film.kmc_sim_rejection_free(0.0, total_time, temperature, temperature,
+                                        *cu_thin_film.get_atom_jump_site_matrix(cu_thin_film.generate_cu_al_grid(0.5, (8, 4))), 1)
+    seed_stream(case['seed'])
+    baseline_rss = get_peak_rss()
+    start = timer.perf_counter()
+    lattice = cu_thin_film.generate_cu_al_grid(case['al_concentration'], shape)
+    atom_jump_site_matrix, jump_site_list = cu_thin_film.get_atom_jump_site_matrix(lattice)
+    setup_time = timer.perf_counter() - start
+    time = 0.0
+    if case['mode'] == 'rejection_free':
+        events = count_events(cu_thin_film, 'kmc_sim_rejection_free', lambda args, result: args[6])
+    else:
+        events = count_events(cu_thin_film, 'make_jumps', lambda args, result: args[2])
+    no_steps = 0
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull), events as counter:
+        start = timer.perf_counter()
+        while counter[0] < case['max_events'] and timer.perf_counter() - start < case['max_time']:
+            if case['mode'] == 'rejection_free':
+                time, temperature, atom_jump_site_matrix, jump_site_list = cu_thin_film.kmc_sim_rejection_free(
+                    time, total_time, temperature, temperature, atom_jump_site_matrix, jump_site_list,
+                    case['events_per_step'])
+            else:
+                time, temperature, atom_jump_site_matrix, jump_site_list = cu_thin_film.kmc_sim(
+                    time, total_time, temperature, temperature, atom_jump_site_matrix, jump_site_list,
+                    cu_thin_film.num_steps)
+            no_steps += 1
+        run_time = timer.perf_counter() - start
+    return get_result(case, lattice.size, counter[0], no_steps, setup_time, run_time, baseline_rss,
+                      get_state_bytes(atom_jump_site_matrix, jump_site_list))
+
+
+def run_coarse_case(case):
+    N = case['boxes']
+    box_length = coarse_grained.sample_thickness / N
+    atoms_per_box = int((box_length/coarse_grained.atomic_distance) * (coarse_grained.sample_width/coarse_grained.atomic_distance))
+    coarse_grained.start_temperature = coarse_grained.end_temperature = case['temperature']
+    seed_stream(case['seed'])
+    baseline_rss = get_peak_rss()
+    start = timer.perf_counter()
+    array = coarse_grained.make_array(case['al_concentration'], atoms_per_box, N)
+    jump_site_array = coarse_grained.get_jump_site_array(array)
+    setup_time = timer.perf_counter() - start
+    current_time = 0.0
+    temperature = case['temperature']
+    if case['mode'] == 'tau_leap':
+        events = count_events(coarse_grained, 'make_leap', lambda args, result: result[2])
+    else:
+        events = count_events(coarse_grained, 'make_jumps', lambda args, result: args[2])
+    no_steps = 0
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull), events as counter:
+        start = timer.perf_counter()
+        while counter[0] < case['max_events'] and timer.perf_counter() - start < case['max_time']:
+            if case['mode'] == 'tau_leap':
+                array, current_time, temperature = coarse_grained.coarse_grained_tau_leap(
+                    array, jump_site_array, current_time, np.inf, temperature, box_length)
+            else:
+                array, current_time, temperature = coarse_grained.coarse_grained_kmc(
+                    array, jump_site_array, current_time, np.inf, temperature, box_length)
+            no_steps += 1
+        run_time = timer.perf_counter() - start
+    return get_result(case, N, counter[0], no_steps, setup_time, run_time, baseline_rss, get_state_bytes(array))
+
+
+def run_sparse_case(case):
+    cu_thin_film.jump_backend = case['backend']
+    shape = (int(case['cu_thickness'] / cu_thin_film.distance), case['grid_dim_x'])
+    # compile the kernels before the clock starts
+    sparse_kmc.solute_step(sparse_kmc.make_solute_state([0, 5], 'square', (8, 4)), 0.0, case['temperature'], 1.0)
+    seed_stream(case['seed'])
+    baseline_rss = get_peak_rss()
+    start = timer.perf_counter()
+    state = sparse_kmc.make_solute_state(sparse_kmc.generate_al_sites(case['al_concentration'], shape), 'square', shape)
+    setup_time = timer.perf_counter() - start
+    # steps of about events_per_step attempts, the temperature stays at the one of the case
+    jump_rate = cu_thin_film.diffusion_coefficient_cu(case['temperature']) / cu_thin_film.distance**2
+    tau = case['events_per_step'] / (jump_rate * 4 * max(state['al_sites'].size, 1))
+    no_events = 0
+    no_steps = 0
+    start = timer.perf_counter()
+    while no_events < case['max_events'] and timer.perf_counter() - start < case['max_time']:
+        no_events += sparse_kmc.solute_step(state, 0.0, case['temperature'], tau)[2]
+        no_steps += 1
+    run_time = timer.perf_counter() - start
+    return get_result(case, int(np.prod(shape)), no_events, no_steps, setup_time, run_time, baseline_rss,
+                      get_state_bytes(state))
+
+
+def get_result(case, no_sites, no_events, no_steps, setup_time, run_time, baseline_rss, state_bytes):
+    # sites are lattice sites for the thin film and boxes for the coarse engine
+    peak_rss = get_peak_rss()
+    return dict(case, sites=no_sites, events=no_events, steps=no_steps, setup_time=setup_time, run_time=run_time,
+                events_per_second=no_events / run_time if run_time > 0 else 0.0, peak_rss=peak_rss,
+                rss_bytes_per_site=(peak_rss - baseline_rss) / no_sites, state_bytes_per_site=state_bytes / no_sites)
+
+
+def run_case(case):
+    if case['engine'] == 'sparse':
+        return run_sparse_case(case)
+    return run_thin_film_case(case) if case['engine'] == 'thin_film' else run_coarse_case(case)
+
+
+def get_cases(engines, cu_thicknesses, grid_dims_x, box_counts, seed=0, max_events=200000, max_time=10.0,
+              backend=cu_thin_film.jump_backend, temperature=float(cu_thin_film.end_temperature)):
+    # grid_dims_x None follows cu_thin_film.py: one tenth of the number of rows
+    cases = []
+    budget = {'seed': seed, 'max_events': max_events, 'max_time': max_time, 'temperature': temperature}
+    if 'thin_film' in engines:
+        for mode in thin_film_modes:
+            for cu_thickness in cu_thicknesses:
+                for grid_dim_x in grid_dims_x or [None]:
+                    cases.append(dict(budget, engine='thin_film', mode=mode, backend=backend, cu_thickness=cu_thickness,
+                                      grid_dim_x=grid_dim_x or int(cu_thickness / cu_thin_film.distance) // 10,
+                                      al_concentration=cu_thin_film.al_concentration,
+                                      events_per_step=cu_thin_film.events_per_step))
+    if 'sparse' in engines:
+        for cu_thickness in cu_thicknesses:
+            for grid_dim_x in grid_dims_x or [None]:
+                cases.append(dict(budget, engine='sparse', mode='solute', backend=backend, cu_thickness=cu_thickness,
+                                  grid_dim_x=grid_dim_x or int(cu_thickness / cu_thin_film.distance) // 10,
+                                  al_concentration=cu_thin_film.al_concentration,
+                                  events_per_step=cu_thin_film.events_per_step))
+    if 'coarse' in engines:
+        for mode in coarse_modes:
+            for boxes in box_counts:
+                cases.append(dict(budget, engine='coarse', mode=mode, boxes=boxes,
+                                  al_concentration=coarse_grained.al_concentration))
+    return cases
+
+
+def run_benchmark(cases):
+    results = []
+    for case in cases:
+        with ProcessPoolExecutor(max_workers=1) as executor:
+            results.append(executor.submit(run_case, case).result())
+    return results
+
+
+def get_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def save_benchmark(results, filename):
+    report = {'revision': get_revision(), 'python': platform.python_version(), 'numpy': np.__version__,
+              'machine': platform.platform(), 'processor': platform.processor(), 'results': results}
+    with open(filename, 'w') as f:
+        json.dump(report, f, indent=1)
+
+
+def get_case_key(result):
+    return tuple(sorted((name, value) for name, value in result.items()
+                        if name in ('engine', 'mode', 'backend', 'cu_thickness', 'grid_dim_x', 'boxes', 'seed', 'temperature')))
+
+
+def compare_benchmarks(results, baseline_results, tolerance=0.2):
+    # events/s of every case relative to the same case in the baseline, slower by more than tolerance is a regression
+    baseline = {get_case_key(result): result for result in baseline_results}
+    comparisons = []
+    for result in results:
+        reference = baseline.get(get_case_key(result))
+        if reference and reference['events_per_second'] > 0:
+            ratio = result['events_per_second'] / reference['events_per_second']
+            comparisons.append({'case': result, 'ratio': ratio, 'regression': ratio < 1 - tolerance})
+    return comparisons
+
+
+def get_case_name(result):
+    if result['engine'] in ('thin_film', 'sparse'):
+        return f"{result['engine']} {result['mode']} {int(result['cu_thickness'] / cu_thin_film.distance)}x{result['grid_dim_x']}"
+    return f"coarse {result['mode']} N={result['boxes']}"
+
+
+def parse_list(value, convert=float):
+    return [convert(item) for item in value.split(',')] if value else []
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Throughput and memory benchmark of both KMC engines.')
+    parser.add_argument('--engines', default='thin_film,coarse', help='any of thin_film, sparse, coarse')
+    parser.add_argument('--cu-thickness', default='25e-9,50e-9,100e-9', help='thin film thicknesses in m')
+    parser.add_argument('--grid-dim-x', default='', help='thin film widths in sites, default: rows // 10')
+    parser.add_argument('--boxes', default='10,20,40', help='coarse box counts N')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--max-events', type=int, default=200000, help='event budget per case')
+    parser.add_argument('--max-time', type=float, default=10.0, help='wall time budget per case in s')
+    parser.add_argument('--backend', default=cu_thin_film.jump_backend)
+    parser.add_argument('--temperature', type=float, default=float(cu_thin_film.end_temperature), help='in K')
+    parser.add_argument('--output', default='benchmark.json')
+    parser.add_argument('--compare', metavar='BASELINE', help='benchmark file of an earlier version')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed relative loss of events/s')
+    args = parser.parse_args()
+
+    cases = get_cases(args.engines.split(','), parse_list(args.cu_thickness), parse_list(args.grid_dim_x, int),
+                      parse_list(args.boxes, int), args.seed, args.max_events, args.max_time, args.backend,
+                      args.temperature)
+    results = run_benchmark(cases)
+    save_benchmark(results, args.output)
+    for result in results:
+        print(f"{get_case_name(result)}: {result['events_per_second']:.3g} events/s, setup: {result['setup_time']:.3f} s, "
+              f"peak RSS: {result['peak_rss'] / 2**20:.1f} MiB, state: {result['state_bytes_per_site']:.1f} B/site, "
+              f"RSS growth: {result['rss_bytes_per_site']:.1f} B/site")
+    if args.compare:
+        with open(args.compare) as f:
+            comparisons = compare_benchmarks(results, json.load(f)['results'], args.tolerance)
+        for comparison in comparisons:
+            print(f"{get_case_name(comparison['case'])}: {comparison['ratio']:.2f}x"
+                  f"{'  REGRESSION' if comparison['regression'] else ''}")
+        if any(comparison['regression'] for comparison in comparisons):
+            sys.exit(1)
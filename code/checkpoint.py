@@ -0,0 +1,67 @@
+import os
+import pickle
+
+from rng import stream
+
+# the full state of a run together with the state of the random stream the engines draw from
+
+
+def get_rng_state():
+    return stream.get_state()
+
+
+def set_rng_state(rng_state):
+    stream.set_state(rng_state)
+
+
+def save_checkpoint(filename, state):
+    # written to a temporary file and renamed, a run killed while writing keeps the previous checkpoint
+    state = dict(state, rng_state=get_rng_state())
+    temporary_filename = filename + '.tmp'
+    with open(temporary_filename, 'wb') as f:
+        pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporary_filename, filename)
+
+
+def load_checkpoint(filename):
+    # restores the random stream, the rest of the state is returned
+    with open(filename, 'rb') as f:
+        state = pickle.load(f)
+    set_rng_state(state.pop('rng_state'))
+    return state
+
+
+def truncate_output(filename, size):
+    # drop whatever was written after the checkpoint, the resumed run writes it again
+    if size is not None and os.path.exists(filename) and os.path.getsize(filename) > size:
+        with open(filename, 'r+b') as f:
+            f.truncate(size)
+
+
+def get_spool_file(filename):
+    # the spool file next to an output file, e.g. dump/observables.spool for dump/observables.npz
+    return os.path.splitext(filename)[0] + '.spool'
+
+
+def write_chunk(filename, chunk, offset):
+    # writes one pickled chunk at offset of a spool file and drops whatever followed it (a resumed run writes it
+    # again, a fresh run starts at 0). Returns the size of the file, the offset of the next chunk.
+    with open(filename, 'r+b' if offset else 'wb') as f:
+        f.seek(offset)
+        pickle.dump(chunk, f, protocol=pickle.HIGHEST_PROTOCOL)
+        f.truncate()
+        f.flush()
+        os.fsync(f.fileno())
+        return f.tell()
+
+
+def read_chunks(filename, size):
+    # the chunks written before size
+    chunks = []
+    if size:
+        with open(filename, 'rb') as f:
+            while f.tell() < size:
+                chunks.append(pickle.load(f))
+    return chunks
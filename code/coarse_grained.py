@@ -1,7 +1,12 @@
+import argparse
 import numpy as np
-import matplotlib.pyplot as plt
-import seaborn as sns
-import random
+
+import telemetry
+from async_writer import AsyncWriter
+from checkpoint import get_spool_file, load_checkpoint, save_checkpoint
+from fenwick_tree import build_fenwick_tree, fenwick_search, fenwick_update
+from observables import TimeSeries
+from rng import seed_stream, stream
 
 # constants
 diff_coeff = 1.49e-7  # diffusion coefficient
@@ -21,105 +26,216 @@ atoms_per_box = int((L/atomic_distance) * (sample_width/atomic_distance))
 total_time = 1e6
 default_time_step = total_time/1000
 
+# tau leaping parameters
+coarse_mode = 'kmc'  # 'kmc' (one exchange at a time), 'tau_leap' (binomial batches of exchanges) or 'adaptive'
+leap_epsilon = 0.03  # largest expected relative change of a box population within one leap
+
+# adaptive box parameters, coarse_mode 'adaptive' tau leaps on boxes that are halved at the front and merged where
+# the profile is flat. Widths are powers of two of a unit box, the N boxes of L are the widest.
+adaptive_levels = 9  # times a box of L can be halved, the unit box is L / 2**adaptive_levels wide
+refine_threshold = 0.05  # concentration step to a neighbor, relative to al_concentration, above which a box is halved
+noise_factor = 3  # ... if the step is also larger than this many standard errors of the atom count noise
+merge_threshold = 0.01  # two halves are merged again when they and their outer neighbors differ by less or by noise
+adapt_interval = 10  # leaps between two adaptations
+
+# output parameters
+observables_cadence = 10  # steps between two samples of the Al profile
+observables_file = 'coarse_dump_02/observables.npz'
+seed = None  # None draws a fresh seed
+checkpoint_file = 'coarse_dump_02/checkpoint.pkl'
+checkpoint_interval = 1000  # steps between two checkpoints, 0 disables them
+telemetry_file = 'coarse_dump_02/telemetry.jsonl'  # JSON lines of counters and phase timers, None switches telemetry off
+telemetry_interval = 1.0  # wall seconds between two telemetry records
+async_output = True  # write the box lists on a background thread
+output_queue_size = 8  # box lists waiting to be written before the simulation blocks
+
 # temperature parameters
+start_temperature = 293
 end_temperature = 600
 
 def diffusion_coefficient_cu(temperature):
     return diff_coeff * np.exp(-ActivationEnergy_Cu / (R * temperature))
 
 
-def make_array(al_concentration, atoms_per_box, N):
-    array = np.zeros(N, dtype=object)
-    array[:N//2] = int(al_concentration*atoms_per_box)
-    for i, entry in enumerate(array):
-        al_atoms = entry
-        cu_atoms = atoms_per_box - al_atoms
-        array[i] = {'Al': al_atoms, 'Cu': cu_atoms, 'possible_jumps': None}
-    for i, cell in enumerate(array):
-        if i == 0:
-            cell['possible_jumps'] = min(cell['Al'], array[i+1]['Cu'])
-        elif i == N-1:
-            cell['possible_jumps'] = min(cell['Al'], array[i-1]['Cu'])
-        else:
-            cell['possible_jumps'] = max(min(cell['Al'], array[i+1]['Cu']),
-                                         min(cell['Al'], array[i-1]['Cu']))
+def get_possible_jumps(al, cu):
+    # a box can give at most min(Al, Cu of the neighbor) atoms to either side, take the larger side
+    possible_jumps = np.zeros(al.size, dtype=np.int64)
+    possible_jumps[:-1] = np.minimum(al[:-1], cu[1:])
+    possible_jumps[1:] = np.maximum(possible_jumps[1:], np.minimum(al[1:], cu[:-1]))
+    return possible_jumps
+
+def make_box_array(al, cu, width=None):
+    # width: adaptive boxes only, in unit boxes
+    al = np.asarray(al, dtype=np.int64)
+    cu = np.asarray(cu, dtype=np.int64)
+    possible_jumps = get_possible_jumps(al, cu)
+    array = {'Al': al, 'Cu': cu, 'possible_jumps': possible_jumps,
+             'jump_tree': build_fenwick_tree(possible_jumps), 'total_possible_jumps': int(possible_jumps.sum())}
+    if width is not None:
+        array['width'] = np.asarray(width, dtype=np.int64)
     return array
 
+def make_array(al_concentration, atoms_per_box, N):
+    al = np.zeros(N, dtype=np.int64)
+    al[:N//2] = int(al_concentration*atoms_per_box)
+    cu = atoms_per_box - al
+    return make_box_array(al, cu)
+
+def get_unit_length():
+    return L / 2**adaptive_levels
+
+def make_adaptive_array(al_concentration, N):
+    # the N boxes of make_array made of unit boxes, refined at the front right away. The sites are counted per unit
+    # box, a box has a few sites less than in make_array, the Al count is rounded for the whole box
+    atoms_per_unit = int((get_unit_length()/atomic_distance) * (sample_width/atomic_distance))
+    width = np.full(N, 2**adaptive_levels, dtype=np.int64)
+    al = np.zeros(N, dtype=np.int64)
+    al[:N//2] = int(al_concentration * atoms_per_unit * 2**adaptive_levels)
+    return adapt_boxes(make_box_array(al, atoms_per_unit*width - al, width))
+
+def split_boxes(array, split):
+    # halves the marked boxes, the Al atoms are shared along the limited (minmod) slope of the profile
+    al, cu, width = array['Al'], array['Cu'], array['width']
+    concentration = al / (al + cu)
+    slope = np.zeros(al.size)  # per unit box
+    if al.size > 1:
+        gradient = np.diff(concentration) / ((width[:-1] + width[1:]) / 2)
+        left = np.concatenate([[0.0], gradient])
+        right = np.concatenate([gradient, [0.0]])
+        slope = np.where(left * right > 0, np.sign(left) * np.minimum(np.abs(left), np.abs(right)), 0.0)
+    half_sites = (al + cu) // 2
+    al_first = np.clip(np.rint((concentration - slope * width / 4) * half_sites),
+                       np.maximum(al - half_sites, 0), np.minimum(al, half_sites)).astype(np.int64)
+    counts = np.where(split, 2, 1)
+    first = np.cumsum(counts) - counts
+    new_al = np.repeat(al, counts)
+    new_sites = np.repeat(np.where(split, half_sites, al + cu), counts)
+    new_width = np.repeat(np.where(split, width // 2, width), counts)
+    new_al[first[split]] = al_first[split]
+    new_al[first[split] + 1] = al[split] - al_first[split]
+    return make_box_array(new_al, new_sites - new_al, new_width)
+
+def merge_boxes(array, merge):
+    # merge[i] joins box i + 1 to box i, pairs never overlap
+    group = np.cumsum(np.concatenate([[True], ~merge])) - 1
+    return make_box_array(np.bincount(group, array['Al']).astype(np.int64), np.bincount(group, array['Cu']).astype(np.int64),
+                          np.bincount(group, array['width']).astype(np.int64))
+
+def get_concentration_steps(array):
+    # concentration differences of neighboring boxes and their standard error from the binomial noise of the boxes
+    sites = array['Al'] + array['Cu']
+    concentration = array['Al'] / sites
+    variance = concentration * (1 - concentration) / sites
+    return np.abs(np.diff(concentration)), np.sqrt(variance[:-1] + variance[1:])
+
+def adapt_boxes(array):
+    # merges flat pairs of halves first, then halves boxes at significant steps of the profile and boxes more than
+    # twice as wide as a neighbor until there are none left. Every box keeps its atoms, the total is conserved.
+    # Small boxes are noisy: without the noise terms the front would stay at the unit width for good.
+    max_width = 2**adaptive_levels
+    width = array['width']
+    if width.size > 1:
+        start = np.cumsum(width) - width
+        difference, noise = get_concentration_steps(array)
+        flat = (difference < merge_threshold * al_concentration) | (difference < noise)
+        outer_flat = np.concatenate([[True], flat[:-1]]) & np.concatenate([flat[1:], [True]])
+        outer_width = np.minimum(np.concatenate([[max_width], width[:-2]]), np.concatenate([width[2:], [max_width]]))
+        merge = ((width[:-1] == width[1:]) & (start[:-1] % (2 * width[:-1]) == 0) & (2 * width[:-1] <= max_width) &
+                 flat & outer_flat & (outer_width >= width[:-1]))
+        if merge.any():
+            array = merge_boxes(array, merge)
+    while True:
+        width = array['width']
+        difference, noise = get_concentration_steps(array)
+        significant = (difference > refine_threshold * al_concentration) & (difference > noise_factor * noise)
+        step = np.concatenate([[False], significant]) | np.concatenate([significant, [False]])
+        wider = np.zeros(width.size, dtype=bool)
+        wider[1:] |= width[1:] > 2 * width[:-1]
+        wider[:-1] |= width[:-1] > 2 * width[1:]
+        split = (width > 1) & (step | wider)
+        if not split.any():
+            return array
+        array = split_boxes(array, split)
+
+def get_al_per_box(array):
+    # Al of the N boxes of L, adaptive boxes are summed into the box of L they lie in
+    if 'width' not in array:
+        return array['Al'].copy()
+    start = np.cumsum(array['width']) - array['width']
+    return np.bincount(start // 2**adaptive_levels, array['Al'], minlength=N).astype(np.int64)
+
 def get_jump_site_array(array):
-    jump_site_array = []
-    for i, cell in enumerate(array):
-        if cell['possible_jumps'] > 0:
-            jump_site_array.append(i)
-    return jump_site_array
+    # boxes are picked with probability proportional to their possible jumps
+    return array['jump_tree']
 
 def get_total_possible_jumps(array, jump_site_array):
-    total_possible_jumps = 0
-    for index in jump_site_array:
-        total_possible_jumps += array[index]['possible_jumps']
-    return total_possible_jumps
+    return array['total_possible_jumps']
 
 def update_indices(array, indices):
-    for index in indices:
-        if index < 0 or index >= N-1:
+    al = array['Al']
+    cu = array['Cu']
+    possible_jumps = array['possible_jumps']
+    if telemetry.enabled:
+        start = telemetry.clock()
+    for index in set(indices):
+        if index < 0 or index >= al.size:
             continue
-        elif index == 0:
-            array[index]['possible_jumps'] = min(array[index]['Al'], array[index+1]['Cu'])
-        elif index == N-1:
-            array[index]['possible_jumps'] = min(array[index]['Al'], array[index-1]['Cu'])
-        else:
-            array[index]['possible_jumps'] = max(min(array[index]['Al'], array[index+1]['Cu']),
-                                         min(array[index]['Al'], array[index-1]['Cu']))
+        possible_jumps_left = min(al[index], cu[index-1]) if index > 0 else 0
+        possible_jumps_right = min(al[index], cu[index+1]) if index < al.size - 1 else 0
+        delta = int(max(possible_jumps_left, possible_jumps_right) - possible_jumps[index])
+        if delta != 0:
+            possible_jumps[index] += delta
+            fenwick_update(array['jump_tree'], index, delta)
+            array['total_possible_jumps'] += delta
+    if telemetry.enabled:
+        telemetry.add_time('neighbor_update', start)
     return array
 
 def perfom_jump(array, index, jump_index, jump_site_array):
-    if array[jump_index]['Al'] == 0: # add to jump_site_array, if it was empty before
-        jump_site_array.append(jump_index) 
-    array[index]['Al'] -= 1
-    array[index]['Cu'] += 1
-    array[jump_index]['Al'] += 1
-    array[jump_index]['Cu'] -= 1
-    if array[index]['Al'] == 0: # remove from jump_site_array, if it is empty now
-        jump_site_array.remove(index)
-    indices = [index, jump_index]
-    if index < jump_index:
-        indices.append(index-1)
-        indices.append(jump_index+1)
-    else:
-        indices.append(index+1)
-        indices.append(jump_index-1)
+    if telemetry.enabled:
+        start = telemetry.clock()
+    array['Al'][index] -= 1
+    array['Cu'][index] += 1
+    array['Al'][jump_index] += 1
+    array['Cu'][jump_index] -= 1
+    if telemetry.enabled:
+        telemetry.add_time('swap', start)
+    indices = [index-1, index, index+1, jump_index-1, jump_index, jump_index+1]
     array = update_indices(array, indices)
     return array, jump_site_array
 
 def make_jumps(array, jump_site_array, jumps):
+    N = array['Al'].size
     while jumps > 0:
-        random_index = int(random.choice(jump_site_array))
-        if random_index == 0:
-            random_direction = int(random.choice([-1, 1]))
-            if random_direction == -1:
-                continue
-            jump_index= int(random_index + 1)
-            array, jump_site_array = perfom_jump(array, random_index, jump_index, jump_site_array)
-            jumps -= 1
-        elif random_index == N-1:
-            random_direction = int(random.choice([-1, 1]))
-            if random_direction == 1:
-                continue
-            jump_index = int(random_index-1)
-            array, jump_site_array = perfom_jump(array, random_index, jump_index, jump_site_array)
-            jumps -= 1
-        else:
-            random_direction = int(random.choice([-1, 1]))
-            jump_index = int(random_index + random_direction)
-            array, jump_site_array = perfom_jump(array, random_index, jump_index, jump_site_array)
-            jumps -= 1
+        if array['total_possible_jumps'] < 1:
+            raise ValueError('System is stuck, no more jumps possible.')
+        if telemetry.enabled:
+            start = telemetry.clock()
+        random_index = fenwick_search(jump_site_array, stream.uniform() * array['total_possible_jumps'])
+        random_direction = 1 if stream.uniform() < 0.5 else -1
+        jump_index = random_index + random_direction
+        if telemetry.enabled:
+            telemetry.add_time('selection', start)
+        if jump_index < 0 or jump_index >= N: # no box beyond the sample edge
+            if telemetry.enabled:
+                telemetry.count('rejected_edge_directions')
+            continue
+        if array['Cu'][jump_index] == 0: # nothing to exchange with on this side
+            if telemetry.enabled:
+                telemetry.count('rejected_empty_directions')
+            continue
+        array, jump_site_array = perfom_jump(array, random_index, jump_index, jump_site_array)
+        jumps -= 1
     return array, jump_site_array
 
-def coarse_grained_kmc(array, jump_site_array, current_time, total_time, temprature):
+def coarse_grained_kmc(array, jump_site_array, current_time, total_time, temprature, box_length=None):
+    if box_length is None:  # read at call time, a configured run may have changed N
+        box_length = L
     no_of_possible_jumps_total = get_total_possible_jumps(array, jump_site_array)
-    jump_rate = 4*diffusion_coefficient_cu(temprature)/L**2
-    random_number_1 = random.uniform(0, 1)
+    jump_rate = 4*diffusion_coefficient_cu(temprature)/box_length**2
+    random_number_1 = stream.uniform()
     no_actual_jumps = int(no_of_possible_jumps_total * random_number_1)
-    random_number_2 = random.uniform(0, 1)
+    random_number_2 = stream.uniform()
     t_ij = -np.log(random_number_2)/(jump_rate*no_of_possible_jumps_total)
 
     if current_time + t_ij < total_time:
@@ -129,34 +245,193 @@ def coarse_grained_kmc(array, jump_site_array, current_time, total_time, temprat
     else:
         no_actual_jumps = 0
         current_time += default_time_step
+        if telemetry.enabled:
+            telemetry.count('skipped_steps')
     
     temperature = start_temperature + ((end_temperature - start_temperature) * current_time / total_time)
-    print(f'Current time: {current_time}, Current temperature: {temperature}, jumps: {no_actual_jumps}')
+    if telemetry.enabled:
+        telemetry.count('events', no_actual_jumps)
+        telemetry.count('steps')
+        telemetry.maybe_emit(time=current_time, temperature=temperature, jumps=no_actual_jumps, time_step=t_ij)
     
     return array, current_time, temperature
 
 
+def refresh_possible_jumps(array):
+    # bulk update after many boxes changed at once, the tree is rebuilt in place so references stay valid
+    array['possible_jumps'][:] = get_possible_jumps(array['Al'], array['Cu'])
+    array['jump_tree'][:] = build_fenwick_tree(array['possible_jumps'])
+    array['total_possible_jumps'] = int(array['possible_jumps'].sum())
+    return array
 
-if __name__ == '__main__':
-    array = make_array(al_concentration, atoms_per_box, N)
-    jump_site_array = get_jump_site_array(array)
-    print(array[1])
-    current_time = 0
-    start_temperature = 293
-    temperature = start_temperature
-    counter = 0
-    while temperature < 600:
-        array, current_time, temperature = coarse_grained_kmc(array, jump_site_array, current_time, total_time, temperature)
-        counter += 1
-        if counter % 100 == 0:
-            al_array =  [cell['Al'] for cell in array]
-            with open(f'coarse_dump_02/list_t_{current_time:.2f}_temp_{temperature:.2f}.txt', 'w') as f:
-                for item in al_array:
-                    f.write(f"{item} \n") 
-    print(f'steps: {counter} \n')
-    print('cutoff preventions: ')
+def get_exchange_rates(array, jump_rate):
+    # rates of Al from box i to box i+1 (Cu the other way) and from box i+1 to box i (Cu the other way).
+    # Equal boxes exchange at jump_rate = D / L^2 per possible pair, the net flux D (Al_i - Al_i+1) / L^2 between
+    # dilute boxes is Fick's law. For adaptive boxes jump_rate is that of the unit box and the pair rate
+    # 2 jump_rate / (w_i + w_i+1) acts on the concentrations, the same for equal widths, and Fick's law across
+    # the distance of the box centers otherwise
+    al = array['Al']
+    cu = array['Cu']
+    if 'width' not in array:
+        return jump_rate * np.minimum(al[:-1], cu[1:]), jump_rate * np.minimum(al[1:], cu[:-1])
+    width = array['width']
+    pair_rate = 2 * jump_rate / (width[:-1] + width[1:])
+    return (pair_rate * np.minimum(al[:-1] / width[:-1], cu[1:] / width[1:]),
+            pair_rate * np.minimum(al[1:] / width[1:], cu[:-1] / width[:-1]))
+
+def get_leap_time(array, jump_rate, epsilon):
+    # largest leap in which no box is expected to lose more than epsilon of its Al or Cu atoms
+    al = array['Al']
+    cu = array['Cu']
+    right_rate, left_rate = get_exchange_rates(array, jump_rate)
+    al_outflow = np.zeros(al.size)
+    al_outflow[:-1] += right_rate
+    al_outflow[1:] += left_rate
+    cu_outflow = np.zeros(cu.size)
+    cu_outflow[1:] += right_rate
+    cu_outflow[:-1] += left_rate
+    leap_times = [epsilon * np.maximum(population[outflow > 0], 1) / outflow[outflow > 0]
+                  for population, outflow in [(al, al_outflow), (cu, cu_outflow)] if (outflow > 0).any()]
+    if not leap_times:
+        return np.inf
+    return min(leap_time.min() for leap_time in leap_times)
+
+def make_leap(array, jump_rate, tau):
+    # number of exchanges across every box boundary in both directions within tau, drawn in one call each
+    al = array['Al']
+    cu = array['Cu']
+    right_pairs = np.minimum(al[:-1], cu[1:])
+    left_pairs = np.minimum(al[1:], cu[:-1])
+    if 'width' in array:
+        # rate per possible pair, the binomial draws below then have the mean rate * tau
+        right_rate, left_rate = get_exchange_rates(array, jump_rate)
+        right_pair_rate = np.divide(right_rate, right_pairs, out=np.zeros(right_rate.size), where=right_pairs > 0)
+        left_pair_rate = np.divide(left_rate, left_pairs, out=np.zeros(left_rate.size), where=left_pairs > 0)
+    else:
+        right_pair_rate = left_pair_rate = jump_rate
+    while True:
+        jumps_right = stream.binomial(right_pairs, 1 - np.exp(-right_pair_rate * tau))
+        jumps_left = stream.binomial(left_pairs, 1 - np.exp(-left_pair_rate * tau))
+        net_flux = jumps_right - jumps_left # Al atoms crossing from box i to box i+1
+        new_al = al.copy()
+        new_al[:-1] -= net_flux
+        new_al[1:] += net_flux
+        new_cu = cu.copy()
+        new_cu[:-1] += net_flux
+        new_cu[1:] -= net_flux
+        if (new_al >= 0).all() and (new_cu >= 0).all():
+            break
+        # a box would be emptied below zero, retry with a shorter leap
+        tau /= 2
+    al[:] = new_al
+    cu[:] = new_cu
+    array = refresh_possible_jumps(array)
+    return array, tau, int(jumps_right.sum() + jumps_left.sum())
+
+def coarse_grained_tau_leap(array, jump_site_array, current_time, total_time, temprature, box_length=None, epsilon=None):
+    if box_length is None:
+        box_length = L
+    if epsilon is None:
+        epsilon = leap_epsilon
+    # exchange rate of one Al-Cu pair across a box boundary, see get_exchange_rates
+    jump_rate = diffusion_coefficient_cu(temprature)/box_length**2
+    tau = min(get_leap_time(array, jump_rate, epsilon), default_time_step)
+    if telemetry.enabled:
+        start = telemetry.clock()
+    array, tau, no_actual_jumps = make_leap(array, jump_rate, tau)
+    current_time += tau
+
+    temperature = start_temperature + ((end_temperature - start_temperature) * current_time / total_time)
+    if telemetry.enabled:
+        telemetry.add_time('leap', start)
+        telemetry.count('events', no_actual_jumps)
+        telemetry.count('steps')
+        telemetry.maybe_emit(time=current_time, temperature=temperature, jumps=no_actual_jumps, time_step=tau)
+
+    return array, current_time, temperature
 
 
-    
 
+def write_box_list(filename, al_array, width=None):
+    # adaptive boxes add their width in unit boxes to every line
+    with open(filename, 'w') as f:
+        if width is None:
+            f.write(''.join(f"{item} \n" for item in al_array))
+        else:
+            f.write(''.join(f"{item} {box_width} \n" for item, box_width in zip(al_array, width)))
+
+
+def initialize_state(run_seed):
+    # the state a run starts from, in the layout of a checkpoint
+    seed_stream(run_seed)
+    array = make_adaptive_array(al_concentration, N) if coarse_mode == 'adaptive' else make_array(al_concentration, atoms_per_box, N)
+    return {'seed': run_seed, 'time': 0.0, 'temperature': start_temperature, 'counter': 0, 'array': array,
+            'observables': TimeSeries()}
 
+
+def run_simulation(resume_from=None, initial_state=None):
+    # initial_state is a state of initialize_state with the random stream where it left it, e.g. from a cache
+    if resume_from is None:
+        state = initial_state if initial_state is not None else \
+            initialize_state(seed if seed is not None else np.random.SeedSequence().entropy)
+        array = state['array']
+        print(f"Al: {array['Al'][1]}, Cu: {array['Cu'][1]}, possible jumps: {array['possible_jumps'][1]}")
+    else:
+        state = load_checkpoint(resume_from)
+    run_seed = state['seed']
+    array, observables = state['array'], state['observables']
+    current_time, temperature, counter = state['time'], state['temperature'], state['counter']
+    if ('width' in array) != (coarse_mode == 'adaptive'):
+        raise ValueError(f"The state has {'adaptive' if 'width' in array else 'uniform'} boxes, coarse_mode is {coarse_mode}.")
+    if resume_from is None:
+        # a cached initial state may come from a run with another ramp, the configured one applies
+        temperature = start_temperature + ((end_temperature - start_temperature) * current_time / total_time)
+        observables = TimeSeries(get_spool_file(observables_file))
+    jump_site_array = get_jump_site_array(array)
+    if telemetry_file:
+        telemetry.enable(telemetry_file, telemetry_interval)
+    with AsyncWriter(output_queue_size, async_output) as writer:
+        while temperature < end_temperature:
+            if coarse_mode == 'tau_leap':
+                array, current_time, temperature = coarse_grained_tau_leap(array, jump_site_array, current_time, total_time, temperature)
+            elif coarse_mode == 'adaptive':
+                array, current_time, temperature = coarse_grained_tau_leap(array, jump_site_array, current_time, total_time, temperature,
+                                                                           get_unit_length())
+            else:
+                array, current_time, temperature = coarse_grained_kmc(array, jump_site_array, current_time, total_time, temperature)
+            counter += 1
+            if coarse_mode == 'adaptive' and counter % adapt_interval == 0:
+                if telemetry.enabled:
+                    start = telemetry.clock()
+                array = adapt_boxes(array)
+                jump_site_array = get_jump_site_array(array)
+                if telemetry.enabled:
+                    telemetry.add_time('adapt', start)
+            if counter % observables_cadence == 0:
+                observables.append(time=current_time, temperature=temperature, al_per_box=get_al_per_box(array),
+                                   possible_jumps=array['total_possible_jumps'], no_boxes=array['Al'].size)
+            if telemetry.enabled:
+                start = telemetry.clock()
+            if counter % 100 == 0:
+                writer.submit(write_box_list, f'coarse_dump_02/list_t_{current_time:.2f}_temp_{temperature:.2f}.txt',
+                              array['Al'].copy(), array['width'].copy() if 'width' in array else None)
+            if checkpoint_interval and counter % checkpoint_interval == 0:
+                writer.flush()  # the box lists before the checkpoint are on disk when it is written
+                observables.spill()  # the checkpoint holds the size of the spool file, not the samples
+                save_checkpoint(checkpoint_file, {'seed': run_seed, 'time': current_time, 'temperature': temperature,
+                                                  'counter': counter, 'array': array, 'observables': observables})
+            if telemetry.enabled:
+                telemetry.add_time('dump_io', start)
+    observables.save(observables_file)
+    if telemetry.enabled:
+        telemetry.emit(time=current_time, temperature=temperature, steps=counter, finished=True)
+        telemetry.disable()
+    print(f'steps: {counter} \n')
+    return array, current_time, temperature
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Coarse grained KMC of Al diffusion into a 20 micrometer Cu film.')
+    parser.add_argument('--resume', metavar='CHECKPOINT', help='continue the run saved in this checkpoint file')
+    args = parser.parse_args()
+    run_simulation(args.resume)
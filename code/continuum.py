@@ -0,0 +1,179 @@
+import argparse
+
+import numpy as np
+
+import coarse_grained
+import cu_thin_film
+from coarse_grained import diffusion_coefficient_cu, write_box_list
+from jump_kernel import HAVE_NUMBA, select_kernels
+from observables import TimeSeries
+
+if HAVE_NUMBA:
+    from numba import njit
+
+# deterministic mean field counterpart of both engines: 1D diffusion dc/dt = D(T(t)) d2c/dx2 across the film depth,
+# Crank-Nicolson in time, finite volumes with closed (zero flux) surfaces in space, the Arrhenius law, linear
+# temperature ramp, geometry and half filled start profile of the engine it stands in for. The profile is reported
+# in the unit of that engine: mean Al atoms per box (coarse_grained.py) or per lattice row (cu_thin_film.py).
+# Every parameter may be an array, all parameter sets are solved together, which is how scans should call it.
+
+cells_per_bin = 8  # finite volume cells per box or row of the output profile
+time_steps = 1000  # Crank-Nicolson steps over the total time
+startup_steps = 2  # the first steps are backward Euler, which damps the oscillations of the sharp start profile
+observables_file = 'continuum_dump/observables.npz'
+box_list_file = 'continuum_dump/list_t_{time:.2f}_temp_{temperature:.2f}.txt'
+
+
+def _build_kernels(jit):
+
+    @jit
+    def crank_nicolson_kernel(concentration, rates, thetas, sample_steps, samples):
+        # concentration (parameter sets, cells) is advanced in place, rates[step, set] = D dt / dx^2 of a step.
+        # theta 0.5 is Crank-Nicolson, 1 backward Euler. After step sample_steps[k] - 1 the profile goes to
+        # samples[k], a sample step 0 is the start profile. The tridiagonal system is solved by the Thomas algorithm.
+        no_sets, no_cells = concentration.shape
+        right_hand_side = np.empty(no_cells)
+        modified_upper = np.empty(no_cells)
+        k = 0
+        while k < sample_steps.size and sample_steps[k] == 0:
+            samples[k] = concentration
+            k += 1
+        for step in range(rates.shape[0]):
+            theta = thetas[step]
+            for s in range(no_sets):
+                c = concentration[s]
+                explicit = (1.0 - theta) * rates[step, s]
+                implicit = theta * rates[step, s]
+                # (1 - explicit part of the Laplacian) c, a closed surface has one neighbor only
+                for i in range(no_cells):
+                    flux = 0.0
+                    if i > 0:
+                        flux += c[i - 1] - c[i]
+                    if i < no_cells - 1:
+                        flux += c[i + 1] - c[i]
+                    right_hand_side[i] = c[i] + explicit * flux
+                # forward sweep with the off diagonal -implicit and diagonal 1 + implicit * neighbors
+                diagonal = 1.0 + implicit * (1 if no_cells > 1 else 0)
+                modified_upper[0] = -implicit / diagonal
+                right_hand_side[0] = right_hand_side[0] / diagonal
+                for i in range(1, no_cells):
+                    diagonal = 1.0 + implicit * (2 if i < no_cells - 1 else 1)
+                    denominator = diagonal + implicit * modified_upper[i - 1]
+                    modified_upper[i] = -implicit / denominator
+                    right_hand_side[i] = (right_hand_side[i] + implicit * right_hand_side[i - 1]) / denominator
+                # back substitution
+                c[no_cells - 1] = right_hand_side[no_cells - 1]
+                for i in range(no_cells - 2, -1, -1):
+                    c[i] = right_hand_side[i] - modified_upper[i] * c[i + 1]
+            while k < sample_steps.size and sample_steps[k] == step + 1:
+                samples[k] = concentration
+                k += 1
+
+    return crank_nicolson_kernel
+
+
+crank_nicolson_python = _build_kernels(lambda function: function)
+crank_nicolson_numba = _build_kernels(njit) if HAVE_NUMBA else None
+
+
+def get_kernel(backend='numba'):
+    return select_kernels(crank_nicolson_python, crank_nicolson_numba, backend)
+
+
+def solve_profile(al_per_bin, thickness, start_temperature, end_temperature, total_time, sample_fractions=(1.0,),
+                  steps=time_steps, backend=cu_thin_film.jump_backend):
+    # al_per_bin is the start profile (bins,) or (parameter sets, bins); temperatures and total time are scalars
+    # or one per parameter set. Returns the sample times, their temperatures and the profiles, with the
+    # parameter set axis only if any input had it: (samples, [sets]), (samples, [sets]), (samples, [sets], bins)
+    al_per_bin = np.asarray(al_per_bin, dtype=float)
+    single = al_per_bin.ndim == 1 and all(np.ndim(value) == 0 for value in
+                                          (thickness, start_temperature, end_temperature, total_time))
+    al_per_bin = np.atleast_2d(al_per_bin)
+    al_per_bin, thickness, start_temperature, end_temperature, total_time = np.broadcast_arrays(
+        al_per_bin, *(np.reshape(value, (-1, 1)) for value in (thickness, start_temperature, end_temperature, total_time)))
+    thickness, start_temperature, end_temperature, total_time = (value[:, 0] for value in
+                                                                 (thickness, start_temperature, end_temperature, total_time))
+    no_sets, no_bins = al_per_bin.shape
+
+    # cells of a bin start with its mean, the profile is reported as the sum over the cells of each bin
+    concentration = np.ascontiguousarray(np.repeat(al_per_bin / cells_per_bin, cells_per_bin, axis=1))
+    cell_width = thickness / (no_bins * cells_per_bin)
+    dt = total_time / steps
+    # the temperature and so D of a step are taken at its midpoint
+    midpoints = (np.arange(steps)[:, None] + 0.5) * dt
+    temperatures = start_temperature + (end_temperature - start_temperature) * midpoints / total_time
+    rates = np.ascontiguousarray(diffusion_coefficient_cu(temperatures) * dt / cell_width**2)
+    thetas = np.full(steps, 0.5)
+    thetas[:startup_steps] = 1.0
+    sample_steps = np.round(np.asarray(sample_fractions, dtype=float) * steps).astype(np.int64)
+    if (np.diff(sample_steps) < 0).any() or sample_steps.min(initial=0) < 0 or sample_steps.max(initial=0) > steps:
+        raise ValueError('Sample fractions must be sorted and between 0 and 1.')
+    samples = np.empty((sample_steps.size,) + concentration.shape)
+    get_kernel(backend)(concentration, rates, thetas, sample_steps, samples)
+
+    times = sample_steps[:, None] * dt
+    sample_temperatures = start_temperature + (end_temperature - start_temperature) * times / total_time
+    profiles = samples.reshape(sample_steps.size, no_sets, no_bins, cells_per_bin).sum(axis=3)
+    if single:
+        return times[:, 0], sample_temperatures[:, 0], profiles[:, 0]
+    return times, sample_temperatures, profiles
+
+
+def get_start_profile(geometry):
+    # (Al per bin, thickness, start temperature, end temperature, total time) of the engine, with its half filled
+    # start profile: make_array puts int(al_concentration * atoms_per_box) atoms in the first N // 2 boxes,
+    # generate_cu_al_grid makes the sites of the first rows // 2 rows Al with probability al_concentration
+    if geometry == 'coarse':
+        al_per_bin = np.zeros(coarse_grained.N)
+        al_per_bin[:coarse_grained.N // 2] = int(coarse_grained.al_concentration * coarse_grained.atoms_per_box)
+        return (al_per_bin, coarse_grained.sample_thickness, coarse_grained.start_temperature,
+                coarse_grained.end_temperature, coarse_grained.total_time)
+    if geometry == 'thin_film':
+        shape = cu_thin_film.get_lattice_shape()
+        al_per_bin = np.zeros(shape[0])
+        al_per_bin[:shape[0] // 2] = cu_thin_film.al_concentration * np.prod(shape[1:])
+        return (al_per_bin, cu_thin_film.cu_thickness, cu_thin_film.initial_temperature,
+                cu_thin_film.end_temperature, cu_thin_film.total_time)
+    raise ValueError(f'Unknown geometry: {geometry}')
+
+
+def get_profile_name(geometry):
+    return 'al_per_box' if geometry == 'coarse' else 'al_per_row'
+
+
+def compare_with_kmc(filename, geometry='coarse'):
+    # deviation of the mean field profile from the sampled profiles of a KMC observables file, per sample the
+    # root mean square difference over the bins relative to the Al per bin of the filled half at the start
+    observables = np.load(filename)
+    al_per_bin, thickness, start_temperature, end_temperature, total_time = get_start_profile(geometry)
+    kmc_profiles = observables[get_profile_name(geometry)]
+    # the solver samples on its step grid, time_steps per total time
+    times, temperatures, profiles = solve_profile(al_per_bin, thickness, start_temperature, end_temperature,
+                                                  total_time, np.minimum(observables['time'] / total_time, 1.0))
+    deviation = np.sqrt(((kmc_profiles - profiles)**2).mean(axis=1)) / al_per_bin.max()
+    return observables['time'], deviation
+
+
+def run_simulation(geometry='coarse', no_samples=100):
+    al_per_bin, thickness, start_temperature, end_temperature, total_time = get_start_profile(geometry)
+    times, temperatures, profiles = solve_profile(al_per_bin, thickness, start_temperature, end_temperature,
+                                                  total_time, np.linspace(0, 1, no_samples + 1)[1:])
+    observables = TimeSeries()
+    for time, temperature, profile in zip(times, temperatures, profiles):
+        observables.append(time=time, temperature=temperature, **{get_profile_name(geometry): profile})
+    observables.save(observables_file)
+    write_box_list(box_list_file.format(time=times[-1], temperature=temperatures[-1]), profiles[-1])
+    return times, temperatures, profiles
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Crank-Nicolson solution of the mean Al profile of either engine.')
+    parser.add_argument('--geometry', default='coarse', choices=['coarse', 'thin_film'])
+    parser.add_argument('--samples', type=int, default=100, help='profiles saved over the run')
+    parser.add_argument('--compare', metavar='OBSERVABLES', help='KMC observables file to check against the solution')
+    args = parser.parse_args()
+    if args.compare:
+        for time, deviation in zip(*compare_with_kmc(args.compare, args.geometry)):
+            print(f'time: {time:.4g}, relative RMS deviation: {deviation:.3g}')
+    else:
+        run_simulation(args.geometry, args.samples)
@@ -1,8 +1,17 @@
+import argparse
 import numpy as np
-import matplotlib.pyplot as plt
-import random
-import seaborn as sns
-import pandas as pd
+
+import telemetry
+from async_writer import AsyncWriter
+from checkpoint import get_spool_file, load_checkpoint, save_checkpoint, truncate_output
+from event_log import EventLog
+from fenwick_tree import build_fenwick_tree
+from jump_kernel import get_make_jumps_kernel, get_rejection_free_kernel
+from jump_site_set import JumpSiteSet
+from lattice import build_lattice, count_unlike_neighbors, get_default_shape
+from observables import Observables
+from rng import seed_stream, stream
+from trajectory_io import TrajectoryWriter
 
 # constants
 diff_coeff = 1.49e-7  # diffusion coefficient
@@ -16,127 +25,211 @@ number_of_atoms_in_y = cu_thickness / distance
 # parameters
 grid_dim_y = int(number_of_atoms_in_y)
 grid_dim_x = grid_dim_y // 10
+lattice_kind = 'square'  # 'square', 'simple_cubic' or 'fcc' (12 nearest neighbors, conventional cell of 4 sites)
+periodic = False  # True, False or one flag per axis, axis 0 is the depth of the film
 total_time = 5 
 al_concentration = 0.1  
 initial_temperature = 500
 end_temperature = 600  
 num_steps = 10
 time = 0 
+kmc_mode = 'rejection_free'  # 'rejection_free' (residence time / n-fold way) or 'step'
+events_per_step = 1000
+random_number_block = 4096  # rejection free mode: events drawn at once by the compiled kernel
+batch_jumps = False  # step mode: apply the jumps of a step as conflict-free vectorized batches instead of one by one
+jump_backend = 'numba'  # 'numba' or 'python', numba falls back to python if it is not installed
+seed = None  # None draws a fresh seed, it is stored in the trajectory header either way
+trajectory_file = 'dump/trajectory.kmc'
+trajectory_compression = None  # None or 'zlib'
+record_events = False  # log every swap with its time, the lattice can then be rebuilt at any time
+event_log_file = 'dump/event_log.npz'
+keyframe_interval = 1000000  # events between two full lattices in the event log
+record_observables = True  # Al per row, Al-Cu bonds and interface width, updated with every jump
+observables_interval = total_time / 1000  # simulated time between two samples
+observables_file = 'dump/observables.npz'
+checkpoint_file = 'dump/checkpoint.pkl'
+checkpoint_interval = 300  # kmc_sim calls between two checkpoints, 0 disables them
+telemetry_file = 'dump/telemetry.jsonl'  # JSON lines of counters and phase timers, None switches telemetry off
+telemetry_interval = 1.0  # wall seconds between two telemetry records
+async_output = True  # write snapshots on a background thread
+output_queue_size = 8  # snapshots waiting to be written before the simulation blocks
 
 
 
 def diffusion_coefficient_cu(temperature):
     return diff_coeff * np.exp(-ActivationEnergy_Cu / (R * temperature))
 
-def generate_cu_al_grid(percent_aluminum):
+def get_lattice_shape():
+    if lattice_kind == 'fcc':
+        # distance is the nearest neighbor distance, a cubic FCC cell is sqrt(2) of it wide
+        cells_in_depth = int(cu_thickness / (distance * np.sqrt(2)))
+        return get_default_shape(lattice_kind, cells_in_depth, cells_in_depth // 10)
+    return get_default_shape(lattice_kind, grid_dim_y, grid_dim_x)
+
+def generate_cu_al_grid(percent_aluminum, shape=None):
+    if shape is None:
+        shape = get_lattice_shape()
     
-    grid = np.zeros((grid_dim_y, grid_dim_x))
+    grid = np.zeros(shape)
 
-    grid[:grid_dim_y//2,:] = np.random.choice([0, 1], size=(grid_dim_y//2, grid_dim_x), p=[1-percent_aluminum, percent_aluminum])
+    grid[:shape[0]//2] = stream.generator.choice([0, 1], size=(shape[0]//2,) + tuple(shape[1:]), p=[1-percent_aluminum, percent_aluminum])
 
     return grid
 
 
-def get_coordinates_of_neighbors(row, col):
-    nearby_atoms = []
-    directions = [(1, 0), (-1, 0), (0, 1), (0, -1)] # down, up, right, left
-    for direction in directions:
-        i = row + direction[0]
-        j = col + direction[1]
-        if 0 <= i < grid_dim_y and 0 <= j < grid_dim_x:
-            nearby_atoms.append((i, j))
-    return nearby_atoms
-
-
-def get_atom_jump_site_matrix(grid):
-    jump_site_list = []
-    new_grid = np.zeros((grid_dim_y, grid_dim_x), dtype=object)
-    for i in range(grid_dim_y):
-        for j in range(grid_dim_x):
-            neighbors = []
-            possible_jump_sites = []
-            no_possible_jump_sites = 0
-            current_type = grid[i, j]
-            neighbors = get_coordinates_of_neighbors(i, j)
-            possible_jump_sites = [neighbor for neighbor in neighbors if grid[neighbor]  != current_type]
-            for possible_jump_site in possible_jump_sites: # make sure jump sites are unique
-                if possible_jump_site not in jump_site_list: 
-                    jump_site_list.append(possible_jump_site)
-            no_possible_jump_sites = len(possible_jump_sites)
-            new_grid[i, j] = {'type': current_type, 'possible_jump_sites_coordinates': possible_jump_sites,
-                              'no_possible_jump_sites': no_possible_jump_sites,'neighbors_coordinates': neighbors}
-            
-    return new_grid, jump_site_list
-
-def get_type_matrix(grid):
-    values = np.zeros((grid_dim_y, grid_dim_x))
-    for i in range(grid_dim_y):
-        for j in range(grid_dim_x):
-            values[i, j] = grid[i, j]['type']
-    return values
-
-def get_updated_matrix(atom_jump_site_matrix, jump_site_list, jump_from, jump_to):
-    #make the jump
-    jump_from_type = atom_jump_site_matrix[jump_from]['type']
-    jump_to_type = atom_jump_site_matrix[jump_to]['type']
-    atom_jump_site_matrix[jump_from[0], jump_from[1]]['type'] = jump_to_type
-    atom_jump_site_matrix[jump_to[0], jump_to[1]]['type'] = jump_from_type
-    # create a list of coordinates to update
-    coordinates_to_update = [jump_from, jump_to]
-    for coordinates in atom_jump_site_matrix[jump_from]['neighbors_coordinates']:
-        if coordinates not in coordinates_to_update:
-            coordinates_to_update.append(coordinates)
-    for coordinates in atom_jump_site_matrix[jump_to]['neighbors_coordinates']:
-        if coordinates not in coordinates_to_update:
-            coordinates_to_update.append(coordinates)
-    # upate coordinates 
-    for coordinates in coordinates_to_update:
-        neighbors = []
-        possible_jump_sites = []
-        no_possible_jump_sites = 0
-        current_type = atom_jump_site_matrix[coordinates]['type']
-        neighbors = atom_jump_site_matrix[coordinates]['neighbors_coordinates']
-        possible_jump_sites = [neighbor for neighbor in neighbors if atom_jump_site_matrix[neighbor]['type'] != current_type]
-        no_possible_jump_sites = len(possible_jump_sites)
-        atom_jump_site_matrix[coordinates]['possible_jump_sites_coordinates'] = possible_jump_sites
-        atom_jump_site_matrix[coordinates]['no_possible_jump_sites'] = no_possible_jump_sites
-        for possible_jump_site in possible_jump_sites:
-            if possible_jump_site not in jump_site_list:
-                jump_site_list.append(possible_jump_site)
+def get_lattice(shape):
+    return build_lattice(lattice_kind, shape, periodic)
+
+
+def get_no_possible_jump_sites(types, lattice=None):
+    # number of unlike neighbors of every site, in the shape of types
+    if lattice is None:
+        lattice = get_lattice(types.shape)
+    return count_unlike_neighbors(types.ravel(), lattice).reshape(types.shape)
+
+
+def get_atom_jump_site_matrix(grid, lattice=None):
+    # lattice defaults to lattice_kind with the periodic flags of this module, its neighbor table is shared
+    if lattice is None:
+        lattice = get_lattice(grid.shape)
+    types = grid.astype(np.int8)
+    no_possible_jump_sites = get_no_possible_jump_sites(types, lattice).ravel()
+    jump_site_list = JumpSiteSet.from_sites(types.size, np.flatnonzero(no_possible_jump_sites))
+    atom_jump_site_matrix = {'type': types.ravel(), 'neighbor_start': lattice['neighbor_start'],
+                             'neighbors': lattice['neighbors'], 'max_degree': lattice['max_degree'],
+                             'no_possible_jump_sites': no_possible_jump_sites, 'shape': grid.shape,
+                             # twice the number of Al-Cu bonds
+                             'no_possible_jump_sites_total': np.array([no_possible_jump_sites.sum()], dtype=np.int64)}
     return atom_jump_site_matrix, jump_site_list
 
-def make_sure_to_find_tuple(jump_from, jump_site_list):
-    if type(jump_from) != tuple:
-        jump_from = random.choice(jump_site_list)
-        make_sure_to_find_tuple(jump_from, jump_site_list)
-    return jump_from
+def get_type_matrix(atom_jump_site_matrix):
+    # a view on the species array, it changes with every further jump
+    return atom_jump_site_matrix['type'].reshape(atom_jump_site_matrix['shape'])
 
-def get_jump_to_list(jump_from, jump_site_list, atom_jump_site_matrix):
-    jump_to_list = atom_jump_site_matrix[jump_from]['possible_jump_sites_coordinates']
-    if len(jump_to_list) < 1:
-        jump_site_list.remove(jump_from)
-        jump_from = random.choice(jump_site_list)
-        jump_to_list, jump_site_list = get_jump_to_list(jump_from, jump_site_list, atom_jump_site_matrix)
+def make_jumps(atom_jump_site_matrix, jump_site_list, no_of_jumps, time=0.0):
+    # two uniform numbers per jump: one picks the jump site, one picks its unlike neighbor
+    random_numbers = stream.uniforms((no_of_jumps, 2))
+    jumps = np.empty((no_of_jumps, 2), dtype=np.int32)
+    make_jumps_kernel = get_make_jumps_kernel(jump_backend)
+    if telemetry.enabled:
+        start = telemetry.clock()
+    jump_site_list.size, no_stale = make_jumps_kernel(atom_jump_site_matrix['type'], atom_jump_site_matrix['neighbor_start'],
+                                                      atom_jump_site_matrix['neighbors'],
+                                                      atom_jump_site_matrix['no_possible_jump_sites'],
+                                                      atom_jump_site_matrix['no_possible_jump_sites_total'],
+                                                      jump_site_list.sites, jump_site_list.position, jump_site_list.size,
+                                                      random_numbers, jumps)
+    if no_stale:
+        jumps = jumps[jumps[:, 0] >= 0]
+    if telemetry.enabled:
+        # selection, swap and neighbor update all happen inside the kernel
+        telemetry.add_time('kernel', start)
+        telemetry.count('events', len(jumps))
+        count_stale_jump_sites(no_stale)
+    # the kernel does not maintain a rate tree, it is rebuilt when needed
+    atom_jump_site_matrix.pop('rate_tree', None)
+    record_jumps(atom_jump_site_matrix, jumps, time)
+    return atom_jump_site_matrix, jump_site_list
 
-    if len(jump_site_list) < 1:
-        raise ValueError('System is stuck, no more jumps possible.')
-    return jump_to_list, jump_site_list
+def count_stale_jump_sites(no_stale):
+    # picked jump sites without an unlike neighbor, the jump site set is exact, so this should stay 0
+    if no_stale:
+        telemetry.count('stale_jump_sites', int(no_stale))
 
-def make_jumps(atom_jump_site_matrix, jump_site_list, no_of_jumps):
+def record_jumps(atom_jump_site_matrix, jumps, time, jump_times=None):
+    # jumps holds (site the Al atom left, site it moved to) rows, made at jump_times or all at time
+    event_log = atom_jump_site_matrix.get('event_log')
+    if event_log is not None:
+        event_log.record_many(jumps[:, 0], jumps[:, 1], time if jump_times is None else jump_times)
+        event_log.maybe_add_keyframe(atom_jump_site_matrix['type'], time)
+    observables = atom_jump_site_matrix.get('observables')
+    if observables is not None:
+        observables.record_jumps(jumps[:, 0], jumps[:, 1])
+
+def get_padded_neighbors(atom_jump_site_matrix, sites):
+    # neighbors of every site as one row of max_degree entries, -1 where a site has fewer
+    neighbor_start = atom_jump_site_matrix['neighbor_start']
+    columns = np.arange(atom_jump_site_matrix['max_degree'])
+    entries = neighbor_start[sites][:, None] + columns
+    present = columns < (neighbor_start[sites + 1] - neighbor_start[sites])[:, None]
+    return np.where(present, atom_jump_site_matrix['neighbors'][np.where(present, entries, 0)], -1)
+
+def recount_sites(atom_jump_site_matrix, jump_site_list, sites):
+    # unlike neighbors of the given sites after their types were changed in bulk, duplicates are fine
+    types = atom_jump_site_matrix['type']
+    no_possible_jump_sites = atom_jump_site_matrix['no_possible_jump_sites']
+    sites = np.unique(sites)
+    neighbors = get_padded_neighbors(atom_jump_site_matrix, sites)
+    counts = ((neighbors >= 0) & (types[neighbors] != types[sites][:, None])).sum(axis=1)
+    atom_jump_site_matrix['no_possible_jump_sites_total'][0] += int(counts.sum()) - int(no_possible_jump_sites[sites].sum())
+    no_possible_jump_sites[sites] = counts
+    jump_site_list.discard_many(sites[counts == 0])
+    jump_site_list.add_many(sites[counts > 0])
+
+def make_jumps_batch(atom_jump_site_matrix, jump_site_list, no_of_jumps, time=0.0):
+    # the jumps are drawn in rounds: every round picks as many candidate jumps as are left, keeps those whose
+    # regions (both sites and all their neighbors) overlap with no other kept candidate and applies them at once.
+    # Kept jumps cannot influence each other, but a round draws all candidates from the same jump site set, so
+    # the sequence of jumps is an approximation of make_jumps, like the step mode itself.
+    types = atom_jump_site_matrix['type']
+    no_possible_jump_sites = atom_jump_site_matrix['no_possible_jump_sites']
+    if telemetry.enabled:
+        start = telemetry.clock()
+    all_jumps = []
+    no_stale = 0
     while no_of_jumps > 0:
-        jump_from = random.choice(jump_site_list)
-        jump_to_list, jump_site_list = get_jump_to_list(jump_from, jump_site_list, atom_jump_site_matrix) 
-        
-        jump_to = random.choice(jump_to_list)
-        if jump_to in jump_site_list:
-            jump_site_list.remove(jump_to)
-        if jump_from in jump_site_list:
-            jump_site_list.remove(jump_from)
-        atom_jump_site_matrix, jump_site_list = get_updated_matrix(atom_jump_site_matrix, jump_site_list, jump_from, jump_to)
-
-        no_of_jumps -= 1
+        if len(jump_site_list) < 1:
+            raise ValueError('System is stuck, no more jumps possible.')
+        # more candidates than a tenth of the jump sites mostly collide with each other
+        random_numbers = stream.uniforms((min(no_of_jumps, max(len(jump_site_list) // 10, 1)), 2))
+        jump_from = jump_site_list.sites[(random_numbers[:, 0] * len(jump_site_list)).astype(np.int64)]
+        # the m-th unlike neighbor of every jump_from
+        from_neighbors = get_padded_neighbors(atom_jump_site_matrix, jump_from)
+        unlike = (from_neighbors >= 0) & (types[from_neighbors] != types[jump_from][:, None])
+        m = (random_numbers[:, 1] * no_possible_jump_sites[jump_from]).astype(np.int64)
+        chosen = unlike & (np.cumsum(unlike, axis=1) == m[:, None] + 1)
+        jump_to = from_neighbors[np.arange(jump_from.size), np.argmax(chosen, axis=1)]
+        # a site without the unlike neighbor its count promises is not jumped from
+        stale = ~chosen.any(axis=1)
+        no_stale += int(stale.sum())
+
+        # a candidate is kept when it is the first one (lowest index) in every site of its region
+        region = np.concatenate([jump_from[:, None], from_neighbors, get_padded_neighbors(atom_jump_site_matrix, jump_to)], axis=1)
+        candidate = np.broadcast_to(np.arange(jump_from.size)[:, None], region.shape)[region >= 0]
+        region_sites = region[region >= 0]
+        order = np.lexsort((candidate, region_sites))
+        first = np.ones(order.size, dtype=bool)
+        first[1:] = region_sites[order[1:]] != region_sites[order[:-1]]
+        owner = candidate[order][np.maximum.accumulate(np.where(first, np.arange(order.size), 0))]
+        kept = ~stale
+        kept[candidate[order][owner != candidate[order]]] = False
+        jump_from = jump_from[kept]
+        jump_to = jump_to[kept]
+
+        # swap, then recount every site of the kept regions
+        from_types = types[jump_from]
+        types[jump_from] = types[jump_to]
+        types[jump_to] = from_types
+        recount_sites(atom_jump_site_matrix, jump_site_list, region[kept][region[kept] >= 0])
+
+        al_moves = from_types == 1
+        all_jumps.append(np.stack([np.where(al_moves, jump_from, jump_to), np.where(al_moves, jump_to, jump_from)], axis=1))
+        no_of_jumps -= jump_from.size
+    jumps = np.concatenate(all_jumps) if all_jumps else np.empty((0, 2), dtype=np.int32)
+    if telemetry.enabled:
+        telemetry.add_time('batch', start)
+        telemetry.count('events', len(jumps))
+        telemetry.count('batch_rounds', len(all_jumps))
+        count_stale_jump_sites(no_stale)
+    atom_jump_site_matrix.pop('rate_tree', None)
+    record_jumps(atom_jump_site_matrix, jumps, time)
     return atom_jump_site_matrix, jump_site_list
 
+def sample_observables(atom_jump_site_matrix, time, temperature):
+    observables = atom_jump_site_matrix.get('observables')
+    if observables is not None:
+        observables.maybe_sample(time, temperature, int(atom_jump_site_matrix['no_possible_jump_sites_total'][0]) // 2)
+
 def kmc_sim(time ,total_time, temperature, end_temperature, atom_jump_site_matrix, jump_site_list , num_steps=10):
     current_temperature = temperature
     current_time = time
@@ -145,44 +238,164 @@ def kmc_sim(time ,total_time, temperature, end_temperature, atom_jump_site_matri
 
     jump_rate = 4*diffusion_coefficient_cu(temperature) / distance**2
 
-    random_nr_1 = random.uniform(0, 1)
+    random_nr_1 = stream.uniform()
 
     no_actual_jumps = int(no_possible_jumps * random_nr_1)
 
-    random_nr_2 = random.uniform(0, 1)
+    random_nr_2 = stream.uniform()
     t_ij =-np.log(random_nr_2) / (no_actual_jumps*jump_rate) #calculate time step
 
     if t_ij < total_time/num_steps: # check if the time is small enough
         current_time += t_ij 
-        atom_jump_site_matrix, jump_site_list = make_jumps(atom_jump_site_matrix, jump_site_list, no_actual_jumps)
+        if batch_jumps:
+            atom_jump_site_matrix, jump_site_list = make_jumps_batch(atom_jump_site_matrix, jump_site_list, no_actual_jumps, current_time)
+        else:
+            atom_jump_site_matrix, jump_site_list = make_jumps(atom_jump_site_matrix, jump_site_list, no_actual_jumps, current_time)
 
     else: # if the time is too large, perform no jump at all
         no_actual_jumps = 0
+        if telemetry.enabled:
+            telemetry.count('skipped_steps')
         t_ij = total_time/num_steps     
         current_time += t_ij
 
     # update temperature
-    current_temperature = initial_temperature + ((end_temperature - initial_temperature) * (current_time / total_time))
-    print('current time: ', current_time, 'current temperature: ', current_temperature, 'jumps executed: ', no_actual_jumps, 'time step: ', t_ij)
+    current_temperature = get_temperature(current_time, total_time, end_temperature)
+    sample_observables(atom_jump_site_matrix, current_time, current_temperature)
+    if telemetry.enabled:
+        telemetry.count('steps')
+        telemetry.maybe_emit(time=current_time, temperature=current_temperature, jumps=no_actual_jumps, time_step=t_ij)
     return current_time, current_temperature, atom_jump_site_matrix, jump_site_list
 
+def get_temperature(time, total_time, end_temperature):
+    # linear ramp from initial_temperature at time 0 to end_temperature at total_time
+    return initial_temperature + ((end_temperature - initial_temperature) * (time / total_time))
 
-if __name__ == '__main__':
+def kmc_sim_rejection_free(time, total_time, temperature, end_temperature, atom_jump_site_matrix, jump_site_list, num_events=1000):
+    # residence time algorithm: every event is executed, time advances by -ln(u)/R_total. The events are made by
+    # the compiled kernel of jump_kernel.py, which keeps the rate tree up to date. At most num_events events,
+    # fewer if the anneal ends first: an event whose waiting time reaches past total_time is not made, the time
+    # stops at total_time (waiting times are memoryless, cutting one off is exact). For the same reason the
+    # kernel can stop at every observables sample time, the samples see the lattice at exactly that time.
+    if 'rate_tree' not in atom_jump_site_matrix:
+        # site weights are the number of unlike neighbors, every Al-Cu bond is counted from both of its sites
+        atom_jump_site_matrix['rate_tree'] = build_fenwick_tree(atom_jump_site_matrix['no_possible_jump_sites'].astype(np.int64))
+    rejection_free_kernel = get_rejection_free_kernel(jump_backend)
+    observables = atom_jump_site_matrix.get('observables')
+    current_time = time
+    no_events = 0
+
+    while no_events < num_events and current_time < total_time:
+        sample_observables(atom_jump_site_matrix, current_time, get_temperature(current_time, total_time, end_temperature))
+        stop_time = total_time if observables is None else min(total_time, observables.next_sample_time)
+        no_block_events = min(num_events - no_events, random_number_block)
+        random_numbers = stream.uniforms((no_block_events, 3))
+        jumps = np.empty((no_block_events, 2), dtype=np.int32)
+        jump_times = np.empty(no_block_events)
+        if telemetry.enabled:
+            start = telemetry.clock()
+        # the rates follow the ramp from the first event on, whatever temperature the caller passed. All scalars
+        # are floats, numba compiles the kernel once per combination of argument types
+        jump_site_list.size, current_time, no_block_events, no_stale = rejection_free_kernel(
+            atom_jump_site_matrix['type'], atom_jump_site_matrix['neighbor_start'], atom_jump_site_matrix['neighbors'],
+            atom_jump_site_matrix['no_possible_jump_sites'], atom_jump_site_matrix['no_possible_jump_sites_total'],
+            jump_site_list.sites, jump_site_list.position, jump_site_list.size, atom_jump_site_matrix['rate_tree'],
+            diff_coeff / distance**2, ActivationEnergy_Cu / R, float(initial_temperature), float(end_temperature),
+            float(total_time), float(current_time), float(stop_time), random_numbers, jumps, jump_times)
+        if telemetry.enabled:
+            telemetry.add_time('kernel', start)
+            count_stale_jump_sites(no_stale)
+        record_jumps(atom_jump_site_matrix, jumps[:no_block_events], current_time, jump_times[:no_block_events])
+        no_events += no_block_events
+
+    # exactly end_temperature at the end of the anneal, the caller loops until it is reached
+    current_temperature = end_temperature if current_time >= total_time else get_temperature(current_time, total_time, end_temperature)
+    if telemetry.enabled:
+        telemetry.count('events', no_events)
+        telemetry.count('steps')
+        telemetry.maybe_emit(time=current_time, temperature=current_temperature, jumps=no_events)
+    return current_time, current_temperature, atom_jump_site_matrix, jump_site_list
+
+
+def initialize_state(run_seed):
+    # the state a run starts from, in the layout of a checkpoint
+    seed_stream(run_seed)
     # Generate CuAl grid
     lattice = generate_cu_al_grid(al_concentration)
-    time = 0
-    save_list = []
-    temperature = 293.0
-    counter = 0
     atom_jump_site_matrix, jump_site_list = get_atom_jump_site_matrix(lattice)
-    while temperature < end_temperature:
-        current_time, current_temperature, atom_jump_site_matrix, jump_site_list = kmc_sim(time, total_time, temperature, end_temperature,
-                                                            atom_jump_site_matrix, jump_site_list, num_steps)
-        time = current_time
-        temperature = current_temperature
-        counter += 1
-        if counter % 30 == 0:
-            lattice = get_type_matrix(atom_jump_site_matrix)
-            save_list = [time, temperature, lattice]
-            lattice.tofile(f'dump/lattice_t_{time:.2f}_temp_{temperature:.2f}.bin')
-    
\ No newline at end of file
+    return {'seed': run_seed, 'time': 0.0, 'temperature': initial_temperature, 'counter': 0,
+            'atom_jump_site_matrix': atom_jump_site_matrix, 'jump_site_list': jump_site_list}
+
+
+def run_simulation(resume_from=None, initial_state=None):
+    # initial_state is a state of initialize_state with the random stream where it left it, e.g. from a cache
+    if resume_from is None:
+        state = initial_state if initial_state is not None else \
+            initialize_state(seed if seed is not None else np.random.SeedSequence().entropy)
+    else:
+        state = load_checkpoint(resume_from)
+    run_seed = state['seed']
+    time, temperature, counter = state['time'], state['temperature'], state['counter']
+    atom_jump_site_matrix, jump_site_list = state['atom_jump_site_matrix'], state['jump_site_list']
+    if resume_from is None:
+        # a cached initial state may come from a run with another ramp, the configured one applies
+        temperature = get_temperature(time, total_time, end_temperature)
+        lattice = get_type_matrix(atom_jump_site_matrix).copy()
+        if record_events:
+            atom_jump_site_matrix['event_log'] = EventLog(lattice, time, keyframe_interval, get_spool_file(event_log_file))
+        if record_observables:
+            atom_jump_site_matrix['observables'] = Observables(lattice, observables_interval,
+                                                               spool_file=get_spool_file(observables_file))
+    else:
+        truncate_output(trajectory_file, state['trajectory_size'])
+    if telemetry_file:
+        telemetry.enable(telemetry_file, telemetry_interval)
+    constants = {'diff_coeff': diff_coeff, 'ActivationEnergy_Cu': ActivationEnergy_Cu, 'distance': distance, 'R': R,
+                 'cu_thickness': cu_thickness, 'al_concentration': al_concentration, 'total_time': total_time,
+                 'initial_temperature': initial_temperature, 'end_temperature': end_temperature, 'kmc_mode': kmc_mode}
+    with TrajectoryWriter(trajectory_file, atom_jump_site_matrix['shape'], run_seed, constants,
+                          compression=trajectory_compression, append=resume_from is not None) as trajectory, \
+            AsyncWriter(output_queue_size, async_output) as writer:
+        while temperature < end_temperature:
+            if kmc_mode == 'rejection_free':
+                current_time, current_temperature, atom_jump_site_matrix, jump_site_list = kmc_sim_rejection_free(time, total_time, temperature, end_temperature,
+                                                                    atom_jump_site_matrix, jump_site_list, events_per_step)
+            else:
+                current_time, current_temperature, atom_jump_site_matrix, jump_site_list = kmc_sim(time, total_time, temperature, end_temperature,
+                                                                    atom_jump_site_matrix, jump_site_list, num_steps)
+            time = current_time
+            temperature = current_temperature
+            counter += 1
+            if telemetry.enabled:
+                start = telemetry.clock()
+            if counter % 30 == 0:
+                writer.submit(trajectory.write_frame, time, temperature, get_type_matrix(atom_jump_site_matrix).copy())
+            if checkpoint_interval and counter % checkpoint_interval == 0:
+                # the checkpoint records the trajectory size, every frame before it has to be on disk
+                writer.flush()
+                trajectory.flush()
+                # the event log and the samples so far go to their spool files, the checkpoint holds their sizes
+                for name in ('event_log', 'observables'):
+                    if name in atom_jump_site_matrix:
+                        atom_jump_site_matrix[name].spill()
+                save_checkpoint(checkpoint_file, {'seed': run_seed, 'time': time, 'temperature': temperature,
+                                                  'counter': counter, 'atom_jump_site_matrix': atom_jump_site_matrix,
+                                                  'jump_site_list': jump_site_list,
+                                                  'trajectory_size': trajectory.f.tell()})
+            if telemetry.enabled:
+                telemetry.add_time('dump_io', start)
+    if record_events:
+        atom_jump_site_matrix['event_log'].save(event_log_file)
+    if record_observables:
+        atom_jump_site_matrix['observables'].save(observables_file)
+    if telemetry.enabled:
+        telemetry.emit(time=time, temperature=temperature, steps=counter, finished=True)
+        telemetry.disable()
+    return time, temperature, atom_jump_site_matrix, jump_site_list
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='KMC simulation of Al diffusion into a Cu thin film.')
+    parser.add_argument('--resume', metavar='CHECKPOINT', help='continue the run saved in this checkpoint file')
+    args = parser.parse_args()
+    run_simulation(args.resume)
@@ -0,0 +1,124 @@
+import json
+import os
+import re
+
+import numpy as np
+
+from trajectory_io import TrajectoryReader
+
+# time sorted index of a dump directory: dump_0x (float64 lattice_t_..._temp_....bin), coarse_dump_0x
+# (list_t_..._temp_....txt, one Al count per line) or trajectory files written by trajectory_io.
+# The index is cached in the directory and rebuilt when its files change.
+
+dump_pattern = re.compile(r'(lattice|list)_t_([-\d.e+]+)_temp_([-\d.e+]+)\.(bin|txt)')
+cache_name = '.dump_index.json'
+
+
+def infer_lattice_shape(no_sites):
+    # cu_thin_film.py uses grid_dim_x = grid_dim_y // 10
+    for grid_dim_y in range(int(np.sqrt(10 * no_sites)) - 10, int(np.sqrt(10 * no_sites)) + 11):
+        if grid_dim_y > 0 and grid_dim_y * (grid_dim_y // 10) == no_sites:
+            return grid_dim_y, grid_dim_y // 10
+    raise ValueError(f'Cannot infer the lattice shape of a dump with {no_sites} sites, pass shape explicitly')
+
+
+def scan_directory(directory, shape=None):
+    entries = []
+    for filename in os.listdir(directory):
+        path = os.path.join(directory, filename)
+        match = dump_pattern.fullmatch(filename)
+        if match:
+            kind = match.group(4)
+            if kind == 'bin':
+                entry_shape = shape or infer_lattice_shape(os.path.getsize(path) // 8)
+            else:
+                with open(path) as f:
+                    entry_shape = (sum(1 for line in f if line.strip()),)
+            entries.append({'file': filename, 'kind': kind, 'time': float(match.group(2)),
+                            'temperature': float(match.group(3)), 'shape': list(entry_shape), 'offset': 0, 'frame': 0})
+        elif filename.endswith('.kmc'):
+            reader = TrajectoryReader(path)
+            for frame, (time, temperature) in enumerate(zip(reader.times, reader.temperatures)):
+                offset = int(reader.offsets[frame]) if reader.frames is None else \
+                    reader.data_offset + frame * reader.frames.dtype.itemsize
+                entries.append({'file': filename, 'kind': 'kmc', 'time': float(time), 'temperature': float(temperature),
+                                'shape': list(reader.shape), 'offset': offset, 'frame': frame})
+    entries.sort(key=lambda entry: entry['time'])
+    return entries
+
+
+def get_directory_signature(directory):
+    # changes whenever a dump is added, removed or rewritten
+    signature = []
+    for filename in sorted(os.listdir(directory)):
+        if filename != cache_name:
+            status = os.stat(os.path.join(directory, filename))
+            signature.append([filename, status.st_size, status.st_mtime_ns])
+    return signature
+
+
+class DumpIndex:
+
+    def __init__(self, directory, shape=None, use_cache=True):
+        self.directory = directory
+        self.entries = self.load_entries(shape, use_cache)
+        self.times = np.array([entry['time'] for entry in self.entries])
+        self.temperatures = np.array([entry['temperature'] for entry in self.entries])
+        self.readers = {}
+
+    def load_entries(self, shape, use_cache):
+        cache_path = os.path.join(self.directory, cache_name)
+        signature = get_directory_signature(self.directory)
+        if use_cache and os.path.exists(cache_path):
+            with open(cache_path) as f:
+                cache = json.load(f)
+            if cache['signature'] == signature and cache['shape'] == (list(shape) if shape else None):
+                return cache['entries']
+        entries = scan_directory(self.directory, shape)
+        if use_cache:
+            try:
+                with open(cache_path, 'w') as f:
+                    json.dump({'signature': signature, 'shape': list(shape) if shape else None, 'entries': entries}, f)
+            except OSError:
+                pass  # read only directories are indexed on every load
+        return entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def frame(self, index):
+        # lattice dumps are memory mapped, nothing is read before the data is used
+        entry = self.entries[index]
+        path = os.path.join(self.directory, entry['file'])
+        if entry['kind'] == 'bin':
+            return np.memmap(path, dtype=np.float64, mode='r', offset=entry['offset'], shape=tuple(entry['shape']))
+        if entry['kind'] == 'txt':
+            return np.loadtxt(path, dtype=np.int64, ndmin=1)
+        if entry['file'] not in self.readers:
+            self.readers[entry['file']] = TrajectoryReader(path)
+        return self.readers[entry['file']][entry['frame']]
+
+    def __getitem__(self, index):
+        return self.frame(index)
+
+    def nearest(self, times):
+        # index of the frame closest in time for every requested time
+        times = np.atleast_1d(np.asarray(times, dtype=float))
+        if len(self.times) < 2:
+            return np.zeros(times.shape, dtype=np.int64)
+        upper = np.clip(np.searchsorted(self.times, times), 1, len(self.times) - 1)
+        lower = upper - 1
+        return np.where(np.abs(self.times[upper] - times) < np.abs(times - self.times[lower]), upper, lower)
+
+    def frames_nearest(self, times):
+        return [self.frame(index) for index in self.nearest(times)]
+
+    def row_profiles(self, indices=None):
+        # one row per frame: the Al concentration per lattice row, or the Al count per box for coarse dumps
+        if indices is None:
+            indices = range(len(self))
+        profiles = []
+        for index in indices:
+            frame = self.frame(index)
+            profiles.append(frame.mean(axis=1) if frame.ndim == 2 else frame)
+        return np.stack(profiles)
@@ -0,0 +1,193 @@
+import argparse
+import itertools
+import json
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import coarse_grained
+import cu_thin_film
+from rng import seed_stream
+
+# parameters a replica can override, with the module defaults of the engine
+thin_film_parameters = {'cu_thickness': cu_thin_film.cu_thickness, 'al_concentration': cu_thin_film.al_concentration,
+                        'initial_temperature': cu_thin_film.initial_temperature,
+                        'end_temperature': cu_thin_film.end_temperature, 'total_time': cu_thin_film.total_time,
+                        'kmc_mode': cu_thin_film.kmc_mode, 'events_per_step': cu_thin_film.events_per_step,
+                        'num_steps': cu_thin_film.num_steps}
+coarse_parameters = {'N': coarse_grained.N, 'al_concentration': coarse_grained.al_concentration,
+                     'start_temperature': coarse_grained.start_temperature,
+                     'end_temperature': coarse_grained.end_temperature, 'total_time': coarse_grained.total_time,
+                     'coarse_mode': coarse_grained.coarse_mode}
+engines = {'thin_film': thin_film_parameters, 'coarse': coarse_parameters}
+modes = {'kmc_mode': ('rejection_free', 'step'), 'coarse_mode': ('kmc', 'tau_leap', 'adaptive')}
+
+
+def seed_replica(seed_sequence):
+    # every replica gets its own substream of the random stream the engines draw from
+    seed_stream(seed_sequence)
+
+
+def record_profiles(profiles, sample_times, current_time, profile):
+    # fill every sampling time the simulation has passed with the current profile
+    for k in range(len(profiles), len(sample_times)):
+        if sample_times[k] > current_time:
+            break
+        profiles.append(profile.copy())
+    return profiles
+
+
+def run_thin_film(parameters, sample_times):
+    shape = (int(parameters['cu_thickness'] / cu_thin_film.distance), int(parameters['cu_thickness'] / cu_thin_film.distance) // 10)
+    cu_thin_film.initial_temperature = parameters['initial_temperature']
+    lattice = cu_thin_film.generate_cu_al_grid(parameters['al_concentration'], shape)
+    atom_jump_site_matrix, jump_site_list = cu_thin_film.get_atom_jump_site_matrix(lattice)
+    time = 0
+    temperature = parameters['initial_temperature']
+    profile = lattice.mean(axis=1)
+    profiles = record_profiles([], sample_times, time, profile)
+    while temperature < parameters['end_temperature'] and len(profiles) < len(sample_times):
+        if parameters['kmc_mode'] == 'rejection_free':
+            time, temperature, atom_jump_site_matrix, jump_site_list = cu_thin_film.kmc_sim_rejection_free(
+                time, parameters['total_time'], temperature, parameters['end_temperature'],
+                atom_jump_site_matrix, jump_site_list, parameters['events_per_step'])
+        else:
+            time, temperature, atom_jump_site_matrix, jump_site_list = cu_thin_film.kmc_sim(
+                time, parameters['total_time'], temperature, parameters['end_temperature'],
+                atom_jump_site_matrix, jump_site_list, parameters['num_steps'])
+        profile = cu_thin_film.get_type_matrix(atom_jump_site_matrix).mean(axis=1)
+        profiles = record_profiles(profiles, sample_times, time, profile)
+    return profiles + [profile] * (len(sample_times) - len(profiles))
+
+
+def get_coarse_profile(array):
+    # Al concentration of the N boxes of L, adaptive boxes are summed into the box of L they lie in
+    if 'width' not in array:
+        return array['Al'] / (array['Al'] + array['Cu'])
+    box = (np.cumsum(array['width']) - array['width']) // 2**coarse_grained.adaptive_levels
+    return np.bincount(box, array['Al']) / np.bincount(box, array['Al'] + array['Cu'])
+
+
+def run_coarse(parameters, sample_times):
+    N = parameters['N']
+    box_length = coarse_grained.sample_thickness / N
+    atoms_per_box = int((box_length/coarse_grained.atomic_distance) * (coarse_grained.sample_width/coarse_grained.atomic_distance))
+    # the adaptive boxes read the box size and the concentration from the module
+    coarse_grained.N, coarse_grained.L, coarse_grained.atoms_per_box = N, box_length, atoms_per_box
+    coarse_grained.al_concentration = parameters['al_concentration']
+    coarse_grained.start_temperature = parameters['start_temperature']
+    coarse_grained.end_temperature = parameters['end_temperature']
+    coarse_grained.default_time_step = parameters['total_time'] / 1000
+    adaptive = parameters['coarse_mode'] == 'adaptive'
+    if adaptive:
+        array = coarse_grained.make_adaptive_array(parameters['al_concentration'], N)
+    else:
+        array = coarse_grained.make_array(parameters['al_concentration'], atoms_per_box, N)
+    jump_site_array = coarse_grained.get_jump_site_array(array)
+    current_time = 0
+    temperature = parameters['start_temperature']
+    no_steps = 0
+    profile = get_coarse_profile(array)
+    profiles = record_profiles([], sample_times, current_time, profile)
+    while temperature < parameters['end_temperature'] and len(profiles) < len(sample_times):
+        if adaptive:
+            array, current_time, temperature = coarse_grained.coarse_grained_tau_leap(
+                array, jump_site_array, current_time, parameters['total_time'], temperature,
+                coarse_grained.get_unit_length())
+        elif parameters['coarse_mode'] == 'tau_leap':
+            array, current_time, temperature = coarse_grained.coarse_grained_tau_leap(
+                array, jump_site_array, current_time, parameters['total_time'], temperature, box_length)
+        else:
+            array, current_time, temperature = coarse_grained.coarse_grained_kmc(
+                array, jump_site_array, current_time, parameters['total_time'], temperature, box_length)
+        no_steps += 1
+        if adaptive and no_steps % coarse_grained.adapt_interval == 0:
+            array = coarse_grained.adapt_boxes(array)
+            jump_site_array = coarse_grained.get_jump_site_array(array)
+        profile = get_coarse_profile(array)
+        profiles = record_profiles(profiles, sample_times, current_time, profile)
+    return profiles + [profile] * (len(sample_times) - len(profiles))
+
+
+def run_replica(engine, parameters, seed_sequence, no_time_bins):
+    seed_replica(seed_sequence)
+    sample_times = np.linspace(0, parameters['total_time'], no_time_bins)
+    run = run_thin_film if engine == 'thin_film' else run_coarse
+    # the step functions print nothing and telemetry is only switched on by run_simulation, workers stay quiet
+    return np.array(run(parameters, sample_times))
+
+
+def get_parameter_sets(engine, parameter_grid):
+    names = list(parameter_grid)
+    parameter_sets = []
+    for values in itertools.product(*(parameter_grid[name] for name in names)):
+        parameters = dict(engines[engine])
+        parameters.update(zip(names, values))
+        for name, allowed in modes.items():
+            if name in parameters and parameters[name] not in allowed:
+                raise ValueError(f"Unknown {name}: {parameters[name]}, one of {', '.join(allowed)}")
+        parameter_sets.append(parameters)
+    return parameter_sets
+
+
+def run_ensemble(engine, parameter_grid=None, no_replicas=8, seed=0, no_time_bins=20, max_workers=None):
+    # returns one entry per parameter set with the mean and variance profile over the replicas for every time bin
+    parameter_sets = get_parameter_sets(engine, parameter_grid or {})
+    seed_sequences = np.random.SeedSequence(seed).spawn(len(parameter_sets) * no_replicas)
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(run_replica, engine, parameters, seed_sequences[i * no_replicas + k], no_time_bins)
+                   for i, parameters in enumerate(parameter_sets) for k in range(no_replicas)]
+        profiles = [future.result() for future in futures]
+    results = []
+    for i, parameters in enumerate(parameter_sets):
+        replica_profiles = np.stack(profiles[i * no_replicas:(i + 1) * no_replicas])
+        results.append({'parameters': parameters,
+                        'times': np.linspace(0, parameters['total_time'], no_time_bins),
+                        'mean': replica_profiles.mean(axis=0),
+                        'variance': replica_profiles.var(axis=0)})
+    return results
+
+
+def save_ensemble(results, filename):
+    arrays = {'parameters': json.dumps([result['parameters'] for result in results])}
+    for i, result in enumerate(results):
+        arrays[f'times_{i}'] = result['times']
+        arrays[f'mean_{i}'] = result['mean']
+        arrays[f'variance_{i}'] = result['variance']
+    np.savez(filename, **arrays)
+
+
+def parse_value(value, default):
+    if isinstance(default, str):
+        return value
+    number = float(value)
+    if isinstance(default, int) and number.is_integer():
+        return int(number)
+    return number
+
+
+def parse_parameter(text, engine):
+    # name=value1,value2,... with numbers parsed like the default value
+    name, values = text.split('=')
+    if name not in engines[engine]:
+        raise argparse.ArgumentTypeError(f'Unknown parameter for {engine}: {name}')
+    return name, [parse_value(value, engines[engine][name]) for value in values.split(',')]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run independent KMC replicas over seeds and parameter grids.')
+    parser.add_argument('engine', choices=list(engines))
+    parser.add_argument('--replicas', type=int, default=8)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--bins', type=int, default=20, help='number of sampling times between 0 and total_time')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes, default: all cores')
+    parser.add_argument('--grid', action='append', default=[], metavar='NAME=V1,V2',
+                        help='parameter values to sweep, can be given several times')
+    parser.add_argument('--output', default='ensemble.npz')
+    args = parser.parse_args()
+
+    parameter_grid = dict(parse_parameter(text, args.engine) for text in args.grid)
+    results = run_ensemble(args.engine, parameter_grid, args.replicas, args.seed, args.bins, args.workers)
+    save_ensemble(results, args.output)
+    for result in results:
+        print(result['parameters'], 'final mean concentration: ', result['mean'][-1].mean())
@@ -0,0 +1,114 @@
+import numpy as np
+
+from checkpoint import read_chunks, write_chunk
+
+# every executed swap as (site_from, site_to, time), 16 bytes per event, plus full keyframes of the lattice
+event_dtype = np.dtype([('site_from', '<i4'), ('site_to', '<i4'), ('time', '<f8')])
+
+
+class EventLog:
+    # with a spool file the events and keyframes can be moved to it (spill, before every checkpoint), the buffer
+    # then holds the events since the last spill only. size counts all events, keyframe_times and
+    # keyframe_events are kept in memory for all keyframes
+
+    def __init__(self, species, time=0.0, keyframe_interval=1000000, spool_file=None):
+        self.shape = species.shape
+        self.keyframe_interval = keyframe_interval
+        self.events = np.empty(1024, dtype=event_dtype)
+        self.size = 0
+        self.keyframes = []
+        self.keyframe_times = []
+        self.keyframe_events = []  # number of events logged before each keyframe
+        self.spool_file = spool_file
+        self.spool_size = 0
+        self.no_spilled = 0  # events in the spool file
+        self.add_keyframe(species, time)
+
+    def __len__(self):
+        return self.size
+
+    def reserve(self, no_events):
+        no_buffered = self.size - self.no_spilled
+        if no_buffered + no_events > len(self.events):
+            events = np.empty(max(2 * len(self.events), no_buffered + no_events), dtype=event_dtype)
+            events[:no_buffered] = self.events[:no_buffered]
+            self.events = events
+
+    def record(self, site_from, site_to, time):
+        self.reserve(1)
+        self.events[self.size - self.no_spilled] = (site_from, site_to, time)
+        self.size += 1
+
+    def record_many(self, sites_from, sites_to, times):
+        no_events = len(sites_from)
+        self.reserve(no_events)
+        new_events = self.events[self.size - self.no_spilled:self.size - self.no_spilled + no_events]
+        new_events['site_from'] = sites_from
+        new_events['site_to'] = sites_to
+        new_events['time'] = times
+        self.size += no_events
+
+    def add_keyframe(self, species, time):
+        self.keyframes.append(np.packbits(species.astype(bool).ravel()))
+        self.keyframe_times.append(time)
+        self.keyframe_events.append(self.size)
+
+    def maybe_add_keyframe(self, species, time):
+        if self.size - self.keyframe_events[-1] >= self.keyframe_interval:
+            self.add_keyframe(species, time)
+
+    def spill(self):
+        if self.spool_file is None or (self.size == self.no_spilled and not self.keyframes):
+            return
+        chunk = {'events': self.events[:self.size - self.no_spilled].copy(), 'keyframes': self.keyframes}
+        self.spool_size = write_chunk(self.spool_file, chunk, self.spool_size)
+        self.no_spilled = self.size
+        self.events = np.empty(1024, dtype=event_dtype)
+        self.keyframes = []
+
+    def get_events(self):
+        # all events, from the spool file and the buffer
+        chunks = read_chunks(self.spool_file, self.spool_size)
+        return np.concatenate([chunk['events'] for chunk in chunks] + [self.events[:self.size - self.no_spilled]])
+
+    def get_keyframes(self):
+        chunks = read_chunks(self.spool_file, self.spool_size)
+        return [keyframe for chunk in chunks for keyframe in chunk['keyframes']] + self.keyframes
+
+    def get_keyframe(self, index, keyframes=None):
+        keyframes = self.get_keyframes() if keyframes is None else keyframes
+        return np.unpackbits(keyframes[index], count=int(np.prod(self.shape))).astype(np.int8)
+
+    def lattice_at(self, time):
+        # every logged swap exchanges an Al and a Cu site, i.e. flips both sites. Flips commute, so the
+        # events since the keyframe reduce to the parity of how often each site took part in one
+        all_events = self.get_events()
+        keyframe = max(int(np.searchsorted(self.keyframe_times, time, side='right')) - 1, 0)
+        start = self.keyframe_events[keyframe]
+        stop = max(int(np.searchsorted(all_events['time'], time, side='right')), start)
+        events = all_events[start:stop]
+        no_sites = int(np.prod(self.shape))
+        flips = np.bincount(events['site_from'], minlength=no_sites) + np.bincount(events['site_to'], minlength=no_sites)
+        species = self.get_keyframe(keyframe) ^ (flips & 1).astype(np.int8)
+        return species.reshape(self.shape)
+
+    def save(self, filename):
+        np.savez(filename, shape=np.array(self.shape), keyframe_interval=self.keyframe_interval,
+                 events=self.get_events(), keyframes=np.array(self.get_keyframes()),
+                 keyframe_times=np.array(self.keyframe_times), keyframe_events=np.array(self.keyframe_events))
+
+    @classmethod
+    def load(cls, filename):
+        with np.load(filename) as data:
+            event_log = cls.__new__(cls)
+            event_log.shape = tuple(data['shape'])
+            event_log.keyframe_interval = int(data['keyframe_interval'])
+            event_log.events = data['events']
+            event_log.size = len(event_log.events)
+            event_log.keyframes = list(data['keyframes'])
+            event_log.keyframe_times = data['keyframe_times'].tolist()
+            event_log.keyframe_events = data['keyframe_events'].tolist()
+            event_log.spool_file = None
+            event_log.spool_size = 0
+            event_log.no_spilled = 0
+        return event_log
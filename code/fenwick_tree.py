@@ -0,0 +1,44 @@
+import numpy as np
+
+# binary indexed tree over non-negative weights, 0-based: tree[i] holds the sum of weights[i & (i + 1) : i + 1]
+
+
+def build_fenwick_tree(weights):
+    weights = np.asarray(weights)
+    cumulative = np.cumsum(weights)
+    lower = np.arange(weights.size) & np.arange(1, weights.size + 1)
+    tree = cumulative.copy()
+    tree[lower > 0] -= cumulative[lower[lower > 0] - 1]
+    return tree
+
+
+def fenwick_update(tree, index, delta):
+    while index < tree.size:
+        tree[index] += delta
+        index |= index + 1
+
+
+def fenwick_prefix_sum(tree, index):
+    # sum of weights[0 : index + 1]
+    total = 0
+    while index >= 0:
+        total += tree[index]
+        index = (index & (index + 1)) - 1
+    return total
+
+
+def fenwick_total(tree):
+    return fenwick_prefix_sum(tree, tree.size - 1)
+
+
+def fenwick_search(tree, value):
+    # smallest index whose prefix sum exceeds value, for 0 <= value < total this picks index i with probability weights[i] / total
+    index = 0
+    step = 1 << (tree.size.bit_length() - 1)
+    while step > 0:
+        upper = index + step
+        if upper <= tree.size and tree[upper - 1] <= value:
+            index = upper
+            value -= tree[upper - 1]
+        step >>= 1
+    return index
@@ -0,0 +1,275 @@
+import argparse
+import os
+
+import numpy as np
+
+import coarse_grained
+import cu_thin_film
+import telemetry
+from jump_kernel import get_residence_time_kernel
+from lattice import build_lattice
+from observables import TimeSeries
+from rng import seed_stream, stream
+
+# hybrid multiscale run of the 20 micrometer film of coarse_grained.py: an atomistic square lattice window of
+# window_boxes * box_rows rows covers the Al/Cu interface, the far field above and below it are two segments of
+# coarse boxes of box_rows lattice rows each. Both descriptions use the same Arrhenius law:
+# - window: every Al-Cu bond is exchanged at D / a^2 (residence time kernel, runs exactly to the end of a sub step)
+# - far field: coarse_grained.make_leap with the pair rate D / L^2 of coarse_grained_tau_leap, the net flux
+#   between two dilute boxes D (Al_i - Al_i+1) / L^2 is Fick's law, like the lattice. The segments end closed at
+#   the window.
+# - handshake: the box next to the window and the edge row of the window exchange Al and Cu across the distance
+#   (L + a) / 2 between box center and row center, see exchange_at_handshake.
+# Every exchange swaps an Al atom with a Cu atom, the Al content of the film is conserved exactly. After every
+# step the window moves by one box towards the interface, the rows leaving it are summed into a box and the box
+# entering it is refined by spreading its Al atoms randomly over its sites.
+
+# parameters
+distance = coarse_grained.atomic_distance
+width = int(round(coarse_grained.sample_width / distance))  # sites across the film
+no_rows = int(coarse_grained.sample_thickness / distance)
+box_rows = 100  # lattice rows per coarse box, the far field has no_rows // box_rows boxes in total
+window_boxes = 8  # height of the atomistic window in boxes
+periodic_width = False  # periodic lateral axis of the window, its depth axis is always open
+al_concentration = coarse_grained.al_concentration
+
+# time parameters
+total_time = coarse_grained.total_time
+time_step = coarse_grained.default_time_step  # simulated time of one step, the window moves between steps
+handshake_exchanges = 1.0  # largest expected number of exchanges across one handshake within a sub step
+leap_epsilon = coarse_grained.leap_epsilon
+start_temperature = coarse_grained.start_temperature
+end_temperature = coarse_grained.end_temperature
+
+# output parameters
+jump_backend = cu_thin_film.jump_backend
+random_number_block = 4096
+seed = None  # None draws a fresh seed
+observables_cadence = 10  # steps between two samples of the Al profile
+observables_file = 'hybrid_dump/observables.npz'
+telemetry_file = 'hybrid_dump/telemetry.jsonl'  # JSON lines of counters and phase timers, None switches telemetry off
+telemetry_interval = 1.0  # wall seconds between two telemetry records
+
+
+def make_hybrid_state(al_concentration):
+    # Al in the upper half of the film as generate_cu_al_grid draws it, the window is centered on the interface
+    no_boxes = no_rows // box_rows
+    box_sites = box_rows * width
+    if no_boxes < window_boxes:
+        raise ValueError(f'The film has {no_boxes} boxes, the window needs {window_boxes}.')
+    interface_row = no_boxes * box_rows // 2
+    first_box = min(max(no_boxes // 2 - window_boxes // 2, 0), no_boxes - window_boxes)
+    last_box = first_box + window_boxes
+    # a box only needs its number of Al atoms
+    al_sites = np.clip(interface_row - np.arange(no_boxes) * box_rows, 0, box_rows) * width
+    box_al = stream.binomial(al_sites, al_concentration).astype(np.int64)
+    rows = first_box * box_rows + np.arange(window_boxes * box_rows)
+    grid = np.zeros((rows.size, width))
+    grid[rows < interface_row] = stream.uniforms(((rows < interface_row).sum(), width)) < al_concentration
+    lattice = build_lattice('square', grid.shape, (False, periodic_width))
+    atom_jump_site_matrix, jump_site_list = cu_thin_film.get_atom_jump_site_matrix(grid, lattice)
+    return {'top': coarse_grained.make_box_array(box_al[:first_box], box_sites - box_al[:first_box]),
+            'bottom': coarse_grained.make_box_array(box_al[last_box:], box_sites - box_al[last_box:]),
+            'window_start': first_box * box_rows, 'window': atom_jump_site_matrix,
+            'jump_site_list': jump_site_list, 'lattice': lattice}
+
+
+def run_window(state, jump_rate, tau):
+    atom_jump_site_matrix = state['window']
+    jump_site_list = state['jump_site_list']
+    residence_time_kernel = get_residence_time_kernel(jump_backend)
+    window_time = 0.0
+    no_jumps = 0
+    while True:
+        random_numbers = stream.uniforms((random_number_block, 3))
+        jump_site_list.size, window_time, no_used, no_window_jumps = residence_time_kernel(
+            atom_jump_site_matrix['type'], atom_jump_site_matrix['neighbor_start'], atom_jump_site_matrix['neighbors'],
+            atom_jump_site_matrix['no_possible_jump_sites'], atom_jump_site_matrix['no_possible_jump_sites_total'],
+            jump_site_list.sites, jump_site_list.position, jump_site_list.size, atom_jump_site_matrix['max_degree'],
+            jump_rate, window_time, tau, random_numbers)
+        no_jumps += no_window_jumps
+        if no_used < random_number_block:
+            break
+    return no_jumps
+
+
+def advance_segment(segment, jump_rate, tau):
+    # tau leaps until the segment reached tau, make_leap shortens a leap that would empty a box
+    segment_time = 0.0
+    no_jumps = 0
+    while segment_time < tau:
+        leap_time = min(coarse_grained.get_leap_time(segment, jump_rate, leap_epsilon), tau - segment_time)
+        segment, leap_time, no_leap_jumps = coarse_grained.make_leap(segment, jump_rate, leap_time)
+        segment_time += leap_time
+        no_jumps += no_leap_jumps
+    return no_jumps
+
+
+def exchange_at_handshake(state, segment, box, edge_row, jump_rate, tau):
+    # exchanges between a box and the window row next to it within tau. Every Cu site of the row takes an Al atom
+    # from the box at jump_rate * c_box, every Al site gives its atom to the box at jump_rate * (1 - c_box), the net
+    # flux jump_rate * width * (c_box - c_row) is Fick's law. Returns the number of Al atoms that entered the window.
+    atom_jump_site_matrix = state['window']
+    types = atom_jump_site_matrix['type']
+    al = segment['Al'][box]
+    cu = segment['Cu'][box]
+    c_box = al / (al + cu)
+    row_sites = np.arange(edge_row * width, (edge_row + 1) * width)
+    row_types = types[row_sites]
+    random_numbers = stream.uniforms(width)
+    gains = row_sites[(row_types == 0) & (random_numbers < 1 - np.exp(-jump_rate * c_box * tau))][:al]
+    losses = row_sites[(row_types == 1) & (random_numbers < 1 - np.exp(-jump_rate * (1 - c_box) * tau))][:cu]
+    if gains.size + losses.size == 0:
+        return 0
+    types[gains] = 1
+    types[losses] = 0
+    changed = np.concatenate([gains, losses])
+    neighbors = cu_thin_film.get_padded_neighbors(atom_jump_site_matrix, changed)
+    cu_thin_film.recount_sites(atom_jump_site_matrix, state['jump_site_list'],
+                               np.concatenate([changed, neighbors[neighbors >= 0]]))
+    net_flux = gains.size - losses.size
+    segment['Al'][box] -= net_flux
+    segment['Cu'][box] += net_flux
+    coarse_grained.update_indices(segment, [box - 1, box, box + 1])
+    return net_flux
+
+
+def hybrid_step(state, current_time, temperature, tau):
+    # the window, both far field segments and the handshakes are advanced together in sub steps short enough
+    # that a handshake sees about handshake_exchanges exchanges per sub step
+    diffusion_coefficient = coarse_grained.diffusion_coefficient_cu(temperature)
+    bond_rate = diffusion_coefficient / distance**2
+    box_rate = diffusion_coefficient / (box_rows * distance)**2
+    handshake_rate = bond_rate * 2 / (box_rows + 1)  # D / (a (L + a) / 2) per site of the edge row
+    sub_step = handshake_exchanges / (handshake_rate * width)
+    no_rows_window = state['window']['shape'][0]
+    no_jumps = 0
+    no_exchanges = 0
+    elapsed = 0.0
+    while elapsed < tau:
+        dt = min(sub_step, tau - elapsed)
+        if telemetry.enabled:
+            start = telemetry.clock()
+        no_jumps += run_window(state, bond_rate, dt)
+        if telemetry.enabled:
+            telemetry.add_time('window', start)
+            start = telemetry.clock()
+        for segment in (state['top'], state['bottom']):
+            no_jumps += advance_segment(segment, box_rate, dt)
+        if telemetry.enabled:
+            telemetry.add_time('far_field', start)
+            start = telemetry.clock()
+        if state['top']['Al'].size:
+            no_exchanges += abs(exchange_at_handshake(state, state['top'], state['top']['Al'].size - 1, 0,
+                                                      handshake_rate, dt))
+        if state['bottom']['Al'].size:
+            no_exchanges += abs(exchange_at_handshake(state, state['bottom'], 0, no_rows_window - 1,
+                                                      handshake_rate, dt))
+        if telemetry.enabled:
+            telemetry.add_time('handshake', start)
+        elapsed += dt
+    move_window(state)
+
+    current_time += tau
+    temperature = start_temperature + ((end_temperature - start_temperature) * current_time / total_time)
+    if telemetry.enabled:
+        telemetry.count('events', no_jumps)
+        telemetry.count('handshake_net_flux', no_exchanges)
+        telemetry.count('steps')
+        telemetry.maybe_emit(time=current_time, temperature=temperature, jumps=no_jumps,
+                             window_start=state['window_start'])
+    return current_time, temperature
+
+
+def get_interface_row(state):
+    # depth of the sharp step between the concentrations on both sides of the window that holds the same number
+    # of Al atoms as the window, None when both sides are alike
+    types = cu_thin_film.get_type_matrix(state['window'])
+    no_rows_window = types.shape[0]
+    top, bottom = state['top'], state['bottom']
+    c_top = top['Al'][-1] / (box_rows * width) if top['Al'].size else types[0].mean()
+    c_bottom = bottom['Al'][0] / (box_rows * width) if bottom['Al'].size else types[-1].mean()
+    if abs(c_top - c_bottom) < al_concentration / 10:
+        return None
+    al_rows = types.sum() / width
+    return state['window_start'] + np.clip((al_rows - c_bottom * no_rows_window) / (c_top - c_bottom), 0, no_rows_window)
+
+
+def refine_box(al):
+    # box_rows rows of the window with the Al atoms of a box on random sites
+    rows = np.zeros(box_rows * width, dtype=np.int8)
+    rows[stream.generator.choice(rows.size, al, replace=False)] = 1
+    return rows.reshape(box_rows, width)
+
+
+def shift_window(state, direction):
+    # moves the window by one box down (direction 1) or up (-1), atoms are conserved box by box
+    types = cu_thin_film.get_type_matrix(state['window'])
+    box_sites = box_rows * width
+    top, bottom = state['top'], state['bottom']
+    if direction > 0:
+        leaving = int(types[:box_rows].sum())
+        types = np.concatenate([types[box_rows:], refine_box(bottom['Al'][0])])
+        state['top'] = coarse_grained.make_box_array(np.append(top['Al'], leaving), np.append(top['Cu'], box_sites - leaving))
+        state['bottom'] = coarse_grained.make_box_array(bottom['Al'][1:], bottom['Cu'][1:])
+    else:
+        leaving = int(types[-box_rows:].sum())
+        types = np.concatenate([refine_box(top['Al'][-1]), types[:-box_rows]])
+        state['top'] = coarse_grained.make_box_array(top['Al'][:-1], top['Cu'][:-1])
+        state['bottom'] = coarse_grained.make_box_array(np.insert(bottom['Al'], 0, leaving), np.insert(bottom['Cu'], 0, box_sites - leaving))
+    state['window_start'] += direction * box_rows
+    state['window'], state['jump_site_list'] = cu_thin_film.get_atom_jump_site_matrix(types, state['lattice'])
+    if telemetry.enabled:
+        telemetry.count('window_shifts')
+
+
+def move_window(state):
+    # one box per step at most, a box of slack on either side keeps the window from jittering
+    interface_row = get_interface_row(state)
+    if interface_row is None:
+        return
+    center = state['window_start'] + state['window']['shape'][0] / 2
+    if interface_row > center + box_rows and state['bottom']['Al'].size:
+        shift_window(state, 1)
+    elif interface_row < center - box_rows and state['top']['Al'].size:
+        shift_window(state, -1)
+
+
+def get_al_per_box(state):
+    # Al profile of the whole film in boxes, the window summed box by box
+    window_al = cu_thin_film.get_type_matrix(state['window']).reshape(-1, box_rows * width).sum(axis=1)
+    return np.concatenate([state['top']['Al'], window_al, state['bottom']['Al']])
+
+
+def run_simulation():
+    run_seed = seed if seed is not None else np.random.SeedSequence().entropy
+    seed_stream(run_seed)
+    state = make_hybrid_state(al_concentration)
+    current_time = 0.0
+    temperature = start_temperature
+    counter = 0
+    observables = TimeSeries()
+    os.makedirs(os.path.dirname(observables_file) or '.', exist_ok=True)
+    if telemetry_file:
+        telemetry.enable(telemetry_file, telemetry_interval)
+    while temperature < end_temperature:
+        current_time, temperature = hybrid_step(state, current_time, temperature, time_step)
+        counter += 1
+        if counter % observables_cadence == 0:
+            observables.append(time=current_time, temperature=temperature, window_start=state['window_start'],
+                               al_per_box=get_al_per_box(state),
+                               al_per_window_row=cu_thin_film.get_type_matrix(state['window']).sum(axis=1))
+    observables.save(observables_file)
+    if telemetry.enabled:
+        telemetry.emit(time=current_time, temperature=temperature, steps=counter, finished=True)
+        telemetry.disable()
+    return state, current_time, temperature
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Hybrid KMC: atomistic window at the Al/Cu interface, coarse boxes elsewhere.')
+    parser.add_argument('--seed', type=int, help='seed of the run, a fresh one is drawn without it')
+    args = parser.parse_args()
+    if args.seed is not None:
+        seed = args.seed
+    run_simulation()
@@ -0,0 +1,224 @@
+import math
+
+import numpy as np
+
+try:
+    from numba import njit
+    HAVE_NUMBA = True
+except ImportError:
+    HAVE_NUMBA = False
+
+
+# event loops over plain arrays: species, CSR neighbor table (neighbor_start, neighbors, see lattice.py), jump
+# counts, their running sum (a one element array), the sites/position arrays of a JumpSiteSet and the Fenwick
+# tree over the jump counts (fenwick_tree.py layout, empty when the caller keeps none). The same source is compiled by
+# numba or run as is, so both backends consume the random numbers identically and give the same
+# trajectory. exp and log come from math, numba calls the same libm functions, the numpy ones can differ in the
+# last bit.
+def _build_kernels(jit):
+
+    @jit
+    def tree_update(rate_tree, index, delta):
+        # fenwick_tree.fenwick_update
+        while index < rate_tree.size:
+            rate_tree[index] += delta
+            index |= index + 1
+
+    @jit
+    def tree_search(rate_tree, value):
+        # fenwick_tree.fenwick_search
+        index = 0
+        step = 1
+        while 2 * step <= rate_tree.size:
+            step *= 2
+        while step > 0:
+            upper = index + step
+            if upper <= rate_tree.size and rate_tree[upper - 1] <= value:
+                index = upper
+                value -= rate_tree[upper - 1]
+            step >>= 1
+        return index
+
+    @jit
+    def update_site(types, neighbor_start, neighbors, no_possible_jump_sites, jump_site_total, sites, position, size,
+                    rate_tree, site):
+        count = 0
+        for k in range(neighbor_start[site], neighbor_start[site + 1]):
+            if types[neighbors[k]] != types[site]:
+                count += 1
+        jump_site_total[0] += count - no_possible_jump_sites[site]
+        if rate_tree.size > 0:
+            tree_update(rate_tree, site, count - no_possible_jump_sites[site])
+        no_possible_jump_sites[site] = count
+        if count > 0 and position[site] < 0:
+            sites[size] = site
+            position[site] = size
+            size += 1
+        elif count == 0 and position[site] >= 0:
+            # move the last member into the freed slot
+            size -= 1
+            last_site = sites[size]
+            sites[position[site]] = last_site
+            position[last_site] = position[site]
+            position[site] = -1
+        return size
+
+    @jit
+    def swap_sites(types, neighbor_start, neighbors, no_possible_jump_sites, jump_site_total, sites, position, size,
+                   rate_tree, jump_from, jump_to):
+        # make the jump
+        jump_from_type = types[jump_from]
+        types[jump_from] = types[jump_to]
+        types[jump_to] = jump_from_type
+        # jump_from and jump_to are neighbors of each other, the two loops recount both of them as well.
+        # Recounting a site twice gives the same result, no need to de-duplicate
+        for k in range(neighbor_start[jump_from], neighbor_start[jump_from + 1]):
+            size = update_site(types, neighbor_start, neighbors, no_possible_jump_sites, jump_site_total, sites,
+                               position, size, rate_tree, neighbors[k])
+        for k in range(neighbor_start[jump_to], neighbor_start[jump_to + 1]):
+            size = update_site(types, neighbor_start, neighbors, no_possible_jump_sites, jump_site_total, sites,
+                               position, size, rate_tree, neighbors[k])
+        return size
+
+    @jit
+    def get_unlike_neighbor(types, neighbor_start, neighbors, site, m):
+        # the m-th unlike neighbor of site
+        for k in range(neighbor_start[site], neighbor_start[site + 1]):
+            neighbor = neighbors[k]
+            if types[neighbor] != types[site]:
+                if m == 0:
+                    return neighbor
+                m -= 1
+        return -1
+
+    @jit
+    def make_jumps_kernel(types, neighbor_start, neighbors, no_possible_jump_sites, jump_site_total, sites, position, size,
+                          random_numbers, jumps):
+        # every executed jump is written to jumps as (site the Al atom left, site it moved to). A picked site
+        # without the unlike neighbor its count promises breaks the invariant of the jump site set: its row is
+        # left at -1 and the number of such picks is returned with the new set size, it should stay 0
+        no_tree = np.empty(0, dtype=np.int64)
+        no_stale = 0
+        for n in range(random_numbers.shape[0]):
+            if size < 1:
+                raise ValueError('System is stuck, no more jumps possible.')
+            jump_from = sites[int(random_numbers[n, 0] * size)]
+            jump_to = get_unlike_neighbor(types, neighbor_start, neighbors, jump_from,
+                                          int(random_numbers[n, 1] * no_possible_jump_sites[jump_from]))
+            if jump_to < 0:
+                jumps[n, 0] = -1
+                jumps[n, 1] = -1
+                no_stale += 1
+                continue
+            if types[jump_from] == 1:
+                jumps[n, 0] = jump_from
+                jumps[n, 1] = jump_to
+            else:
+                jumps[n, 0] = jump_to
+                jumps[n, 1] = jump_from
+            size = swap_sites(types, neighbor_start, neighbors, no_possible_jump_sites, jump_site_total, sites, position, size,
+                              no_tree, jump_from, jump_to)
+        return size, no_stale
+
+    @jit
+    def rejection_free_kernel(types, neighbor_start, neighbors, no_possible_jump_sites, jump_site_total, sites, position,
+                              size, rate_tree, bond_rate_prefactor, activation_temperature, initial_temperature,
+                              end_temperature, total_time, time, max_time, random_numbers, jumps, times):
+        # residence time algorithm on the rate tree: the site is picked with probability proportional to its jump
+        # count, then one of its unlike neighbors, so every Al-Cu bond is equally likely. A bond is exchanged at
+        # bond_rate_prefactor * exp(-activation_temperature / T), T follows the linear ramp event by event.
+        # Three random numbers per event. The event whose waiting time reaches max_time is not made, the time
+        # stops at max_time. Returns the new set size, the time, the number of events and the number of picked
+        # sites without the unlike neighbor their count promises (skipped, should stay 0). Event k is written
+        # to jumps[k] as (site the Al atom left, site it moved to) and made at times[k].
+        no_events = 0
+        no_stale = 0
+        for n in range(random_numbers.shape[0]):
+            no_possible_jumps = jump_site_total[0]
+            if no_possible_jumps < 1:
+                raise ValueError('System is stuck, no more jumps possible.')
+            temperature = initial_temperature + (end_temperature - initial_temperature) * (time / total_time)
+            # every bond is counted from both of its sites
+            total_rate = bond_rate_prefactor * math.exp(-activation_temperature / temperature) * no_possible_jumps / 2
+            time_step = -math.log(1.0 - random_numbers[n, 2]) / total_rate
+            if time + time_step >= max_time:
+                return size, max_time, no_events, no_stale
+            jump_from = tree_search(rate_tree, random_numbers[n, 0] * no_possible_jumps)
+            jump_to = get_unlike_neighbor(types, neighbor_start, neighbors, jump_from,
+                                          int(random_numbers[n, 1] * no_possible_jump_sites[jump_from]))
+            if jump_to < 0:
+                no_stale += 1
+                continue
+            if types[jump_from] == 1:
+                jumps[no_events, 0] = jump_from
+                jumps[no_events, 1] = jump_to
+            else:
+                jumps[no_events, 0] = jump_to
+                jumps[no_events, 1] = jump_from
+            size = swap_sites(types, neighbor_start, neighbors, no_possible_jump_sites, jump_site_total, sites, position, size,
+                              rate_tree, jump_from, jump_to)
+            time += time_step
+            times[no_events] = time
+            no_events += 1
+        return size, time, no_events, no_stale
+
+    @jit
+    def residence_time_kernel(types, neighbor_start, neighbors, no_possible_jump_sites, jump_site_total, sites, position, size,
+                              max_degree, jump_rate, time, max_time, random_numbers):
+        # residence time algorithm with null events: every jump site attempts each of its max_degree directions at
+        # the rate jump_rate / 2, so every Al-Cu bond is exchanged at jump_rate. Directions a site lacks at an open
+        # edge are null events. Three random numbers per attempt. Stops at max_time, when the system is stuck or
+        # when the random numbers run out and returns the new set size, the time, the number of random number
+        # rows used and the number of jumps made.
+        no_directions = max_degree
+        no_jumps = 0
+        no_tree = np.empty(0, dtype=np.int64)
+        for n in range(random_numbers.shape[0]):
+            if size < 1:
+                return size, time, n, no_jumps
+            time += -math.log(1.0 - random_numbers[n, 2]) / (jump_rate / 2 * no_directions * size)
+            if time > max_time:
+                return size, max_time, n, no_jumps
+            jump_from = sites[int(random_numbers[n, 0] * size)]
+            direction = int(random_numbers[n, 1] * no_directions)
+            if direction >= neighbor_start[jump_from + 1] - neighbor_start[jump_from]:
+                continue
+            jump_to = neighbors[neighbor_start[jump_from] + direction]
+            if types[jump_to] == types[jump_from]:
+                continue
+            size = swap_sites(types, neighbor_start, neighbors, no_possible_jump_sites, jump_site_total, sites, position, size,
+                              no_tree, jump_from, jump_to)
+            no_jumps += 1
+        return size, time, random_numbers.shape[0], no_jumps
+
+    return make_jumps_kernel, residence_time_kernel, rejection_free_kernel
+
+
+make_jumps_python, residence_time_python, rejection_free_python = _build_kernels(lambda function: function)
+make_jumps_numba, residence_time_numba, rejection_free_numba = _build_kernels(njit) if HAVE_NUMBA else (None, None, None)
+
+
+def select_kernels(python_kernels, numba_kernels, backend='numba'):
+    # the kernels a _build_kernels made for backend, falls back to the interpreted ones when numba is not installed
+    if backend == 'numba' and HAVE_NUMBA:
+        return numba_kernels
+    if backend in ('numba', 'python'):
+        return python_kernels
+    raise ValueError(f'Unknown jump backend: {backend}')
+
+
+def get_kernels(backend='numba'):
+    return select_kernels((make_jumps_python, residence_time_python, rejection_free_python),
+                          (make_jumps_numba, residence_time_numba, rejection_free_numba), backend)
+
+
+def get_make_jumps_kernel(backend='numba'):
+    return get_kernels(backend)[0]
+
+
+def get_residence_time_kernel(backend='numba'):
+    return get_kernels(backend)[1]
+
+
+def get_rejection_free_kernel(backend='numba'):
+    return get_kernels(backend)[2]
@@ -0,0 +1,78 @@
+import numpy as np
+
+from rng import stream
+
+
+class JumpSiteSet:
+    # set of linear site indices with O(1) add, remove and uniform random pick.
+    # sites[:size] holds the members, position[site] is the slot of a site in sites or -1
+    def __init__(self, n_sites):
+        self.sites = np.empty(n_sites, dtype=np.int32)
+        self.position = np.full(n_sites, -1, dtype=np.int32)
+        self.size = 0
+
+    @classmethod
+    def from_sites(cls, n_sites, sites):
+        jump_site_set = cls(n_sites)
+        sites = np.unique(sites)
+        jump_site_set.sites[:sites.size] = sites
+        jump_site_set.position[sites] = np.arange(sites.size)
+        jump_site_set.size = sites.size
+        return jump_site_set
+
+    def __len__(self):
+        return self.size
+
+    def __contains__(self, site):
+        return self.position[site] >= 0
+
+    def __iter__(self):
+        return iter(self.sites[:self.size].tolist())
+
+    def add(self, site):
+        if self.position[site] >= 0:
+            return
+        self.sites[self.size] = site
+        self.position[site] = self.size
+        self.size += 1
+
+    def remove(self, site):
+        slot = self.position[site]
+        if slot < 0:
+            raise KeyError(site)
+        # move the last member into the freed slot
+        self.size -= 1
+        last_site = self.sites[self.size]
+        self.sites[slot] = last_site
+        self.position[last_site] = slot
+        self.position[site] = -1
+
+    def discard(self, site):
+        if self.position[site] >= 0:
+            self.remove(site)
+
+    def add_many(self, sites):
+        # bulk add, members and duplicates are skipped
+        sites = np.unique(sites)
+        sites = sites[self.position[sites] < 0]
+        self.sites[self.size:self.size + sites.size] = sites
+        self.position[sites] = np.arange(self.size, self.size + sites.size)
+        self.size += sites.size
+
+    def discard_many(self, sites):
+        # bulk discard: the slots freed below the new size are refilled with the surviving members of the tail
+        sites = np.unique(sites)
+        sites = sites[self.position[sites] >= 0]
+        new_size = self.size - sites.size
+        holes = np.sort(self.position[sites][self.position[sites] < new_size])
+        tail = self.sites[new_size:self.size]
+        movers = tail[~np.isin(tail, sites)]
+        self.sites[holes] = movers
+        self.position[movers] = holes
+        self.position[sites] = -1
+        self.size = new_size
+
+    def choice(self):
+        if self.size < 1:
+            raise IndexError('Cannot choose from an empty JumpSiteSet')
+        return int(self.sites[stream.integer(self.size)])
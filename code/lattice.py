@@ -0,0 +1,104 @@
+import numpy as np
+
+# lattice geometry as a CSR neighbor table: the neighbors of site k are neighbors[neighbor_start[k]:neighbor_start[k + 1]].
+# Sites are numbered like a C ordered species array. 2D square and 3D simple cubic lattices have one site per cell,
+# FCC uses the conventional cubic cell with four sites, its species array has the shape cells + (4,).
+# Axis 0 is the depth of the film. Every axis is open or periodic on its own.
+
+# positions are integer multiples of a sub-cell unit: scale units per cell, basis sites and neighbor offsets in them
+lattice_kinds = {
+    # down, up, right, left, the order of the original neighbor lists
+    'square': (1, [(0, 0)], [(1, 0), (-1, 0), (0, 1), (0, -1)]),
+    'simple_cubic': (1, [(0, 0, 0)], [(1, 0, 0), (-1, 0, 0), (0, 1, 0), (0, -1, 0), (0, 0, 1), (0, 0, -1)]),
+    # half the cubic cell, the 12 nearest neighbors are at (+-1, +-1, 0) and its permutations
+    'fcc': (2, [(0, 0, 0), (0, 1, 1), (1, 0, 1), (1, 1, 0)],
+            [(1, 1, 0), (1, -1, 0), (-1, 1, 0), (-1, -1, 0), (1, 0, 1), (1, 0, -1), (-1, 0, 1), (-1, 0, -1),
+             (0, 1, 1), (0, 1, -1), (0, -1, 1), (0, -1, -1)]),
+}
+
+
+def get_cells(kind, shape):
+    # number of cells along every axis for a species array of this shape
+    scale, basis, offsets = lattice_kinds[kind]
+    dimension = len(offsets[0])
+    cells = tuple(shape[:dimension])
+    if (len(basis) > 1 and tuple(shape[dimension:]) != (len(basis),)) or (len(basis) == 1 and len(shape) != dimension):
+        raise ValueError(f'A {kind} lattice has no species array of shape {tuple(shape)}')
+    return cells
+
+
+def get_periodic(periodic, dimension):
+    # True, False or one flag per axis
+    if np.ndim(periodic) == 0:
+        return (bool(periodic),) * dimension
+    if len(periodic) != dimension:
+        raise ValueError(f'Need {dimension} periodic flags, got {len(periodic)}')
+    return tuple(bool(flag) for flag in periodic)
+
+
+def build_lattice(kind, shape, periodic=False):
+    if kind not in lattice_kinds:
+        raise ValueError(f'Unknown lattice: {kind}')
+    scale, basis, offsets = lattice_kinds[kind]
+    basis = np.array(basis, dtype=np.int32)
+    offsets = np.array(offsets, dtype=np.int32)
+    dimension = offsets.shape[1]
+    cells = get_cells(kind, shape)
+    periodic = get_periodic(periodic, dimension)
+    no_basis = len(basis)
+    no_sites = int(np.prod(cells)) * no_basis
+
+    # for a given basis site and offset the neighbor sits in the cell shifted by the same vector everywhere and
+    # has the same basis index, so every column of the table is the cell index grid rolled by that shift
+    basis_index = {tuple(site): b for b, site in enumerate(basis.tolist())}
+    cell_index = np.arange(int(np.prod(cells)), dtype=np.int32).reshape(cells)
+    neighbor_table = np.full(cells + (no_basis, len(offsets)), -1, dtype=np.int32)
+    for b, site in enumerate(basis):
+        for k, offset in enumerate(offsets):
+            shift, neighbor_basis = np.divmod(site + offset, scale)
+            neighbor_cells = cell_index
+            for axis in range(dimension):
+                if shift[axis] != 0:
+                    neighbor_cells = np.roll(neighbor_cells, -shift[axis], axis=axis)
+                    if not periodic[axis]:
+                        # the cells at the far side of the shift have no neighbor there
+                        edge = [slice(None)] * dimension
+                        edge[axis] = slice(-shift[axis], None) if shift[axis] > 0 else slice(None, -shift[axis])
+                        neighbor_cells[tuple(edge)] = -1
+            inside = neighbor_cells >= 0
+            neighbor_table[..., b, k] = np.where(inside, neighbor_cells * no_basis + basis_index[tuple(neighbor_basis)], -1)
+    neighbor_table = neighbor_table.reshape(no_sites, len(offsets))
+
+    # a periodic axis that is too short can make a site its own neighbor or list a neighbor twice
+    if any(flag and no_cells < 3 for flag, no_cells in zip(periodic, cells)):
+        sorted_table = np.sort(neighbor_table, axis=1)
+        if ((sorted_table[:, 1:] == sorted_table[:, :-1]) & (sorted_table[:, 1:] >= 0)).any() or \
+                (neighbor_table == np.arange(no_sites)[:, None]).any():
+            raise ValueError(f'Lattice of {cells} cells is too small for its periodic axes {periodic}')
+
+    present = neighbor_table >= 0
+    neighbor_start = np.zeros(no_sites + 1, dtype=np.int64)
+    np.cumsum(present.sum(axis=1), out=neighbor_start[1:])
+    return {'kind': kind, 'shape': tuple(shape), 'cells': cells, 'periodic': periodic,
+            'neighbor_start': neighbor_start, 'neighbors': neighbor_table[present],
+            'max_degree': len(offsets)}
+
+
+def get_site_of_neighbor_entries(lattice):
+    # the site every entry of the neighbor array belongs to
+    return np.repeat(np.arange(len(lattice['neighbor_start']) - 1, dtype=np.int32), np.diff(lattice['neighbor_start']))
+
+
+def count_unlike_neighbors(types, lattice):
+    # number of neighbors of the other species for every site of the flat species array
+    sites = get_site_of_neighbor_entries(lattice)
+    unlike = types[sites] != types[lattice['neighbors']]
+    return np.bincount(sites[unlike], minlength=types.size).astype(np.int8)
+
+
+def get_default_shape(kind, cells_in_depth, cells_across):
+    if kind == 'square':
+        return (cells_in_depth, cells_across)
+    if kind == 'simple_cubic':
+        return (cells_in_depth, cells_across, cells_across)
+    return (cells_in_depth, cells_across, cells_across, len(lattice_kinds[kind][1]))
@@ -0,0 +1,96 @@
+import numpy as np
+
+from checkpoint import read_chunks, write_chunk
+
+
+class TimeSeries:
+    # columnar time series, one growing list per column, saved as one array per column. With a spool file the
+    # rows can be moved to it (spill, before every checkpoint): the object then only holds the rows since the
+    # last spill and the size of the file, a checkpoint of it stays small however long the run is
+    def __init__(self, spool_file=None):
+        self.columns = {}
+        self.spool_file = spool_file
+        self.spool_size = 0
+        self.no_spilled = 0
+
+    def __len__(self):
+        return self.no_spilled + len(next(iter(self.columns.values()), []))
+
+    def append(self, **values):
+        for name, value in values.items():
+            self.columns.setdefault(name, []).append(value)
+
+    def spill(self):
+        if self.spool_file is None or not self.columns:
+            return
+        no_rows = len(self) - self.no_spilled
+        self.spool_size = write_chunk(self.spool_file, self.columns, self.spool_size)
+        self.no_spilled += no_rows
+        self.columns = {}
+
+    def as_arrays(self):
+        columns = {}
+        for chunk in read_chunks(self.spool_file, self.spool_size) + [self.columns]:
+            for name, values in chunk.items():
+                columns.setdefault(name, []).extend(values)
+        return {name: np.array(values) for name, values in columns.items()}
+
+    def save(self, filename):
+        np.savez(filename, **self.as_arrays())
+
+
+class Observables:
+    # Al count per row and the depth moments of the Al atoms, updated with every jump in O(1).
+    # Rows are counted from the top of the film, depths are in lattice rows.
+    def __init__(self, species, sample_interval, bulk_concentration=None, spool_file=None):
+        self.layer_size = species.size // species.shape[0]
+        self.row_al = species.reshape(species.shape[0], -1).sum(axis=1).astype(np.int64)
+        self.total_al = int(self.row_al.sum())
+        self.depth_sum = float((np.arange(species.shape[0]) + 0.5) @ self.row_al)
+        if bulk_concentration is None:
+            # generate_cu_al_grid fills the upper half of the film
+            bulk_concentration = self.row_al[:species.shape[0]//2].sum() / (species.shape[0]//2 * self.layer_size)
+        self.bulk_concentration = bulk_concentration
+        self.sample_interval = sample_interval
+        self.next_sample_time = -np.inf
+        self.series = TimeSeries(spool_file)
+
+    def record_jump(self, al_from, al_to):
+        row_from = al_from // self.layer_size
+        row_to = al_to // self.layer_size
+        self.row_al[row_from] -= 1
+        self.row_al[row_to] += 1
+        self.depth_sum += row_to - row_from
+
+    def record_jumps(self, al_from, al_to):
+        rows_from = al_from // self.layer_size
+        rows_to = al_to // self.layer_size
+        np.subtract.at(self.row_al, rows_from, 1)
+        np.add.at(self.row_al, rows_to, 1)
+        self.depth_sum += float((rows_to - rows_from).sum())
+
+    def get_interface_width(self):
+        # standard deviation of -dc/dy: for a profile falling from the bulk concentration to zero its first two
+        # moments are sum(c) / c_bulk and 2 * sum(y * c) / c_bulk, zero for a sharp step
+        al_per_bulk_row = self.bulk_concentration * self.layer_size
+        if al_per_bulk_row == 0:
+            return 0.0
+        mean = self.total_al / al_per_bulk_row
+        second_moment = 2 * self.depth_sum / al_per_bulk_row
+        return float(np.sqrt(max(second_moment - mean**2, 0)))
+
+    def sample(self, time, temperature, no_unlike_bonds):
+        self.series.append(time=time, temperature=temperature, unlike_bonds=no_unlike_bonds,
+                           interface_width=self.get_interface_width(),
+                           mean_al_depth=self.depth_sum / max(self.total_al, 1), al_per_row=self.row_al.copy())
+
+    def maybe_sample(self, time, temperature, no_unlike_bonds):
+        if time >= self.next_sample_time:
+            self.sample(time, temperature, no_unlike_bonds)
+            self.next_sample_time = time + self.sample_interval
+
+    def spill(self):
+        self.series.spill()
+
+    def save(self, filename):
+        self.series.save(filename)
@@ -0,0 +1,173 @@
+import argparse
+import multiprocessing
+import time as timer
+from multiprocessing import shared_memory
+
+import numpy as np
+
+import cu_thin_film
+from jump_kernel import get_residence_time_kernel
+from lattice import build_lattice
+from rng import RandomStream, seed_stream
+
+# synchronous sublattice KMC: the lattice is cut into 2 * no_workers strips along one axis, every worker owns two
+# neighboring strips. In phase 0 all workers run events inside their even strips, in phase 1 inside their odd
+# strips, so two active strips never touch and the workers can write the shared species array without locks.
+# Every phase rebuilds its event catalog from the shared array, which reconciles the strip boundaries (halos)
+# with whatever the neighbors did in the previous phase. Bonds across a strip boundary are not active in a
+# cycle, the strips are therefore shifted by a random offset every cycle so that no bond stays frozen.
+
+random_number_block = 4096
+
+
+def get_strips(length, no_workers, offset, phase):
+    # (worker, start, stop) of the strips of this phase, shifted by offset, leftovers go to the last worker
+    width = length // (2 * no_workers)
+    if width < 1:
+        raise ValueError(f'Cannot split {length} sites into {2 * no_workers} strips.')
+    strips = []
+    k = -1 if offset > 0 else 0
+    while offset + k * width < length:
+        start = max(offset + k * width, 0)
+        stop = min(offset + (k + 1) * width, length)
+        if k % 2 == phase:
+            strips.append((min(max(k // 2, 0), no_workers - 1), start, stop))
+        k += 1
+    return strips
+
+
+def get_strip_index(axis, start, stop):
+    if axis == 0:
+        return slice(start, stop), slice(None)
+    return slice(None), slice(start, stop)
+
+
+def run_strip(species, axis, start, stop, jump_rate, tau, stream, residence_time_kernel):
+    strip_index = get_strip_index(axis, start, stop)
+    # bonds leaving the strip are cut off by the open edges of the local lattice
+    strip = species[strip_index]
+    atom_jump_site_matrix, jump_site_list = cu_thin_film.get_atom_jump_site_matrix(strip, build_lattice('square', strip.shape))
+    strip_time = 0.0
+    no_jumps = 0
+    while True:
+        random_numbers = stream.uniforms((random_number_block, 3))
+        jump_site_list.size, strip_time, no_used, no_strip_jumps = residence_time_kernel(
+            atom_jump_site_matrix['type'], atom_jump_site_matrix['neighbor_start'], atom_jump_site_matrix['neighbors'],
+            atom_jump_site_matrix['no_possible_jump_sites'], atom_jump_site_matrix['no_possible_jump_sites_total'],
+            jump_site_list.sites, jump_site_list.position, jump_site_list.size, atom_jump_site_matrix['max_degree'],
+            jump_rate, strip_time, tau, random_numbers)
+        no_jumps += no_strip_jumps
+        if no_used < random_number_block:
+            break
+    species[strip_index] = cu_thin_film.get_type_matrix(atom_jump_site_matrix)
+    return no_jumps
+
+
+def worker_loop(worker, no_workers, shm_name, shape, control, jumps, barrier, stream, backend):
+    shm = shared_memory.SharedMemory(name=shm_name)
+    species = np.ndarray(shape, dtype=np.int8, buffer=shm.buf)
+    residence_time_kernel = get_residence_time_kernel(backend)
+    # compile before the clock starts
+    residence_time_kernel(np.zeros(1, dtype=np.int8), np.zeros(2, dtype=np.int64), np.zeros(0, dtype=np.int32),
+                          np.zeros(1, dtype=np.int8), np.zeros(1, dtype=np.int64), np.zeros(1, dtype=np.int32),
+                          np.full(1, -1, dtype=np.int32), 0, 4, 1.0, 0.0, 1.0, np.zeros((0, 3)))
+    barrier.wait()
+    try:
+        while True:
+            barrier.wait()
+            offset, phase, tau, jump_rate, axis, finished = control[:]
+            if finished:
+                break
+            for strip_worker, start, stop in get_strips(shape[int(axis)], no_workers, int(offset), int(phase)):
+                if strip_worker == worker:
+                    jumps[worker] += run_strip(species, int(axis), start, stop, jump_rate, tau, stream,
+                                               residence_time_kernel)
+            barrier.wait()
+    finally:
+        del species
+        shm.close()
+
+
+def run_parallel_kmc(grid, total_time, cycle_time, start_temperature, end_temperature, no_workers=4, axis=1,
+                     seed=0, backend='numba'):
+    # returns the final species array, the time, the temperature, the number of jumps made and the wall time of the cycles
+    shape = grid.shape
+    shm = shared_memory.SharedMemory(create=True, size=grid.size)
+    species = np.ndarray(shape, dtype=np.int8, buffer=shm.buf)
+    species[:] = grid
+    context = multiprocessing.get_context()
+    barrier = context.Barrier(no_workers + 1)
+    control = context.RawArray('d', 6)  # offset, phase, tau, jump rate, axis, stop
+    jumps = context.RawArray('q', no_workers)
+    # one substream per worker, the last one draws the strip offsets
+    streams = RandomStream(seed).spawn(no_workers + 1)
+    workers = [context.Process(target=worker_loop, args=(worker, no_workers, shm.name, shape, control, jumps, barrier,
+                                                         streams[worker], backend), daemon=True)
+               for worker in range(no_workers)]
+    for process in workers:
+        process.start()
+
+    time = 0.0
+    temperature = start_temperature
+    try:
+        barrier.wait()  # all workers are ready
+        start = timer.perf_counter()
+        while time < total_time:
+            tau = min(cycle_time, total_time - time)
+            jump_rate = cu_thin_film.diffusion_coefficient_cu(temperature) / cu_thin_film.distance**2
+            offset = streams[-1].integer(shape[axis] // (2 * no_workers))
+            for phase in (0, 1):
+                control[:] = [offset, phase, tau, jump_rate, axis, 0]
+                barrier.wait()  # start the phase
+                barrier.wait()  # all strips are written back
+            time += tau
+            temperature = start_temperature + ((end_temperature - start_temperature) * (time / total_time))
+        wall_time = timer.perf_counter() - start
+        control[5] = 1
+        barrier.wait()
+        for process in workers:
+            process.join()
+        result = species.copy()
+    finally:
+        for process in workers:
+            if process.is_alive():
+                process.terminate()
+        del species
+        shm.close()
+        shm.unlink()
+    return result, time, temperature, sum(jumps), wall_time
+
+
+def measure_speedup(grid, worker_counts, total_time, cycle_time, temperature, axis=1, seed=0, backend='numba'):
+    # same workload at constant temperature for every worker count, speedup relative to the first entry
+    results = []
+    for no_workers in worker_counts:
+        _, _, _, no_jumps, wall_time = run_parallel_kmc(grid, total_time, cycle_time, temperature, temperature,
+                                                        no_workers, axis, seed, backend)
+        results.append({'workers': no_workers, 'wall_time': wall_time, 'jumps': no_jumps,
+                        'jumps_per_second': no_jumps / wall_time})
+    for result in results:
+        result['speedup'] = results[0]['wall_time'] / result['wall_time']
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Domain decomposed KMC of one thin film lattice on several cores.')
+    parser.add_argument('--workers', default='1,2,4,8', help='worker counts to compare')
+    parser.add_argument('--grid-dim-y', type=int, default=cu_thin_film.grid_dim_y)
+    parser.add_argument('--grid-dim-x', type=int, default=cu_thin_film.grid_dim_x)
+    parser.add_argument('--axis', type=int, default=1, choices=[0, 1], help='axis the lattice is cut along')
+    parser.add_argument('--total-time', type=float, default=100.0)
+    parser.add_argument('--cycle-time', type=float, default=1.0)
+    parser.add_argument('--temperature', type=float, default=cu_thin_film.end_temperature)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--backend', default=cu_thin_film.jump_backend)
+    args = parser.parse_args()
+
+    seed_stream(args.seed)
+    grid = cu_thin_film.generate_cu_al_grid(cu_thin_film.al_concentration, (args.grid_dim_y, args.grid_dim_x))
+    worker_counts = [int(no_workers) for no_workers in args.workers.split(',')]
+    for result in measure_speedup(grid, worker_counts, args.total_time, args.cycle_time, args.temperature,
+                                  args.axis, args.seed, args.backend):
+        print(f"workers: {result['workers']}, wall time: {result['wall_time']:.2f} s, jumps: {result['jumps']}, "
+              f"jumps/s: {result['jumps_per_second']:.3g}, speedup: {result['speedup']:.2f}")
@@ -0,0 +1,75 @@
+import numpy as np
+
+# one seeded numpy Generator for both engines. Scalar draws are served from a pre-drawn block held as a python
+# list, which is cheaper per call than the random module or a numpy scalar; array draws go to the Generator.
+# Parallel workers and replicas get independent substreams through spawn.
+
+block_size = 65536
+
+
+class RandomStream:
+
+    def __init__(self, seed=None, block_size=block_size):
+        self.block_size = block_size
+        self.reseed(seed)
+
+    def reseed(self, seed=None):
+        # seed is an int, a SeedSequence or None for fresh entropy
+        self.seed_sequence = seed if isinstance(seed, np.random.SeedSequence) else np.random.SeedSequence(seed)
+        self.generator = np.random.default_rng(self.seed_sequence)
+        self.block = []
+        self.position = 0
+
+    def refill(self):
+        self.block = self.generator.random(self.block_size).tolist()
+        self.position = 0
+
+    def uniform(self):
+        # uniform in [0, 1)
+        if self.position == len(self.block):
+            self.refill()
+        value = self.block[self.position]
+        self.position += 1
+        return value
+
+    def uniforms(self, size):
+        return self.generator.random(size)
+
+    def integer(self, n):
+        # uniform in range(n), uniform() is inlined here and in choice, they sit in the inner loops
+        if self.position == len(self.block):
+            self.refill()
+        value = int(self.block[self.position] * n)
+        self.position += 1
+        return value if value < n else n - 1
+
+    def choice(self, sequence):
+        if self.position == len(self.block):
+            self.refill()
+        n = len(sequence)
+        index = int(self.block[self.position] * n)
+        self.position += 1
+        return sequence[index if index < n else n - 1]
+
+    def binomial(self, n, p):
+        return self.generator.binomial(n, p)
+
+    def spawn(self, n):
+        return [RandomStream(seed_sequence, self.block_size) for seed_sequence in self.seed_sequence.spawn(n)]
+
+    def get_state(self):
+        return {'bit_generator': self.generator.bit_generator.state, 'block': list(self.block), 'position': self.position}
+
+    def set_state(self, state):
+        self.generator.bit_generator.state = state['bit_generator']
+        self.block = list(state['block'])
+        self.position = state['position']
+
+
+# the stream the engines draw from, reseeded in place so that imported references stay valid
+stream = RandomStream()
+
+
+def seed_stream(seed=None):
+    stream.reseed(seed)
+    return stream
@@ -0,0 +1,154 @@
+import argparse
+import contextlib
+import hashlib
+import json
+import os
+
+import numpy as np
+
+import coarse_grained
+import cu_thin_film
+from checkpoint import load_checkpoint, save_checkpoint
+
+# one run of an engine configured by a dict or a JSON file instead of by editing the module globals. The engines
+# keep reading their globals: every call of a Simulation sets the configured values on the module and restores the
+# previous ones afterwards, so runs of different sizes can follow each other in one process (but not run in
+# threads at the same time). Globals the modules compute from others at import (grid_dim_y from cu_thickness,
+# L and atoms_per_box from N, ...) are computed again from the configuration unless it sets them itself.
+# Initial states are cached on disk as checkpoints at time 0, keyed by geometry, concentration and seed, a sweep
+# that runs the same start again loads it together with the random stream instead of building it. The run is
+# the same either way. Runs without a seed draw a fresh one and are not cached.
+
+default_cache_dir = 'state_cache'
+parameter_types = (bool, int, float, str, tuple, list, type(None))
+
+
+def get_parameter_names(module):
+    # the plain value globals of an engine module
+    return {name for name, value in vars(module).items()
+            if not name.startswith('_') and isinstance(value, parameter_types)}
+
+
+def load_config(filename):
+    with open(filename) as f:
+        return json.load(f)
+
+
+class Simulation:
+    engine = cu_thin_film
+    name = 'thin_film'
+
+    def __init__(self, config=None, cache_dir=default_cache_dir, **parameters):
+        config = dict(config or {}, **parameters)
+        config.pop('engine', None)
+        unknown = set(config) - get_parameter_names(self.engine)
+        if unknown:
+            raise ValueError(f"Unknown {self.name} parameters: {', '.join(sorted(unknown))}")
+        self.config = config
+        self.cache_dir = cache_dir
+        values = {name: getattr(self.engine, name) for name in get_parameter_names(self.engine)}
+        values.update(config)
+        values.update({name: value for name, value in self.get_derived_parameters(values, config).items()
+                       if name not in config})
+        self.parameters = values
+
+    @classmethod
+    def from_file(cls, filename, **kwargs):
+        return cls(load_config(filename), **kwargs)
+
+    @staticmethod
+    def get_derived_parameters(values, config):
+        number_of_atoms_in_y = values['cu_thickness'] / values['distance']
+        grid_dim_y = config.get('grid_dim_y', int(number_of_atoms_in_y))
+        return {'number_of_atoms_in_y': number_of_atoms_in_y, 'grid_dim_y': grid_dim_y, 'grid_dim_x': grid_dim_y // 10,
+                'observables_interval': values['total_time'] / 1000}
+
+    def get_cache_key(self):
+        # None without a fixed seed, called with the configuration applied
+        if self.parameters['seed'] is None:
+            return None
+        geometry = [self.parameters['lattice_kind'], list(cu_thin_film.get_lattice_shape()), self.parameters['periodic']]
+        return [self.name, geometry, self.parameters['al_concentration'], self.parameters['seed']]
+
+    @contextlib.contextmanager
+    def configured(self):
+        previous = {name: getattr(self.engine, name) for name in self.parameters}
+        for name, value in self.parameters.items():
+            setattr(self.engine, name, value)
+        try:
+            yield self.engine
+        finally:
+            for name, value in previous.items():
+                setattr(self.engine, name, value)
+
+    def get_cache_file(self):
+        key = self.get_cache_key()
+        if self.cache_dir is None or key is None:
+            return None
+        digest = hashlib.sha1(json.dumps(key).encode()).hexdigest()[:16]
+        return os.path.join(self.cache_dir, f'{self.name}_{digest}.pkl')
+
+    def get_initial_state(self):
+        # from the cache if possible, the random stream continues where the initialization left it in both cases
+        with self.configured():
+            cache_file = self.get_cache_file()
+            if cache_file is not None and os.path.exists(cache_file):
+                return load_checkpoint(cache_file)
+            run_seed = self.parameters['seed']
+            state = self.engine.initialize_state(run_seed if run_seed is not None else np.random.SeedSequence().entropy)
+            if cache_file is not None:
+                os.makedirs(self.cache_dir, exist_ok=True)
+                save_checkpoint(cache_file, state)
+            return state
+
+    def run(self):
+        initial_state = self.get_initial_state()
+        with self.configured():
+            return self.engine.run_simulation(initial_state=initial_state)
+
+    def resume(self, checkpoint_file):
+        with self.configured():
+            return self.engine.run_simulation(resume_from=checkpoint_file)
+
+
+class CoarseSimulation(Simulation):
+    engine = coarse_grained
+    name = 'coarse'
+
+    @staticmethod
+    def get_derived_parameters(values, config):
+        L = config.get('L', values['sample_thickness'] / values['N'])
+        return {'L': L, 'atoms_per_box': int((L / values['atomic_distance']) * (values['sample_width'] / values['atomic_distance'])),
+                'default_time_step': values['total_time'] / 1000}
+
+    def get_cache_key(self):
+        # adaptive runs start from refined boxes, which depend on the refinement parameters as well
+        if self.parameters['seed'] is None:
+            return None
+        boxes = [self.parameters['N'], self.parameters['atoms_per_box'], self.parameters['coarse_mode']]
+        if self.parameters['coarse_mode'] == 'adaptive':
+            boxes += [self.parameters[name] for name in
+                      ('adaptive_levels', 'refine_threshold', 'noise_factor', 'merge_threshold')]
+        return [self.name, boxes, self.parameters['al_concentration'], self.parameters['seed']]
+
+
+simulations = {'thin_film': Simulation, 'coarse': CoarseSimulation}
+
+
+def load_simulation(filename, **kwargs):
+    # the configuration names its engine with 'engine', thin_film without it
+    config = load_config(filename)
+    return simulations[config.get('engine', 'thin_film')](config, **kwargs)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run either engine from a JSON configuration file.')
+    parser.add_argument('config', help='JSON object of module parameters, "engine" selects thin_film or coarse')
+    parser.add_argument('--cache-dir', default=default_cache_dir, help='cache of initial states, "" disables it')
+    parser.add_argument('--resume', metavar='CHECKPOINT', help='continue the run saved in this checkpoint file')
+    args = parser.parse_args()
+    simulation = load_simulation(args.config, cache_dir=args.cache_dir or None)
+    if args.resume:
+        simulation.resume(args.resume)
+    else:
+        simulation.run()
@@ -0,0 +1,258 @@
+import argparse
+
+import numpy as np
+
+import cu_thin_film
+import telemetry
+from jump_kernel import HAVE_NUMBA, select_kernels
+from lattice import get_cells, get_periodic, lattice_kinds
+from observables import TimeSeries
+from rng import seed_stream, stream
+
+if HAVE_NUMBA:
+    from numba import njit
+
+# solute only engine for dilute films: the state is the list of Al sites and an open addressing hash set of the
+# same sites keyed by linear site index, every site not in the set is Cu. Neighbors are computed from the linear
+# index and the lattice geometry (lattice.py numbering, same kinds and periodic flags), nothing is stored per site,
+# so memory and the cost of a jump scale with the number of Al atoms instead of the lattice volume: about 24-40
+# bytes per Al atom against about 34 bytes per site of the dense engine.
+# Every Al atom attempts each of its max_degree directions at the bond rate D / a^2, attempts onto an Al site or
+# past an open edge are null events. Every Al-Cu bond is exchanged at D / a^2 as in the dense engines, the dilute
+# film wastes few attempts on Al neighbors.
+
+random_number_block = 4096
+time_step = cu_thin_film.observables_interval  # simulated time of one step, the profile is sampled between steps
+observables_file = 'dump/sparse_observables.npz'
+al_sites_file = 'dump/sparse_al_sites.npy'
+generation_rows = 1024  # rows drawn at once when the Al sites are generated
+
+
+# the hash set and the neighbor arithmetic are compiled by numba or run as is, like jump_kernel.py, both backends
+# consume the random numbers identically and give the same trajectory
+def _build_kernels(jit):
+
+    @jit
+    def get_hash(key, mask):
+        # 32 bit integer mix, the product is cut to 32 bits so that the wrapping numba product gives the same bits
+        h = ((key ^ (key >> 16)) * 73244475) & 0xFFFFFFFF
+        return (h ^ (h >> 16)) & mask
+
+    @jit
+    def find_slot(keys, key):
+        # slot holding key or the empty slot where it belongs, linear probing
+        mask = keys.size - 1
+        slot = get_hash(key, mask)
+        while keys[slot] != key and keys[slot] != -1:
+            slot = (slot + 1) & mask
+        return slot
+
+    @jit
+    def remove_key(keys, key):
+        # backward shift deletion: later keys of the probe run move into the hole, no tombstones are needed
+        mask = keys.size - 1
+        slot = find_slot(keys, key)
+        keys[slot] = -1
+        following = (slot + 1) & mask
+        while keys[following] != -1:
+            home = get_hash(keys[following], mask)
+            if ((following - home) & mask) >= ((following - slot) & mask):
+                keys[slot] = keys[following]
+                keys[following] = -1
+                slot = following
+            following = (following + 1) & mask
+
+    @jit
+    def neighbor_site(site, direction, cells, periodic, scale, basis, offsets, basis_lookup):
+        # linear index of the neighbor in direction, -1 past an open edge
+        no_basis = basis.shape[0]
+        cell = site // no_basis
+        b = site - cell * no_basis
+        neighbor_cell = 0
+        cell_stride = 1
+        remainder_index = 0
+        remainder_stride = 1
+        for axis in range(cells.size - 1, -1, -1):
+            coordinate = cell % cells[axis]
+            cell //= cells[axis]
+            position = coordinate * scale + basis[b, axis] + offsets[direction, axis]
+            neighbor_coordinate = position // scale
+            remainder = position - neighbor_coordinate * scale
+            if neighbor_coordinate < 0 or neighbor_coordinate >= cells[axis]:
+                if not periodic[axis]:
+                    return -1
+                neighbor_coordinate %= cells[axis]
+            neighbor_cell += neighbor_coordinate * cell_stride
+            cell_stride *= cells[axis]
+            remainder_index += remainder * remainder_stride
+            remainder_stride *= scale
+        return neighbor_cell * no_basis + basis_lookup[remainder_index]
+
+    @jit
+    def solute_kernel(al_sites, keys, cells, periodic, scale, basis, offsets, basis_lookup, jump_rate, time, max_time,
+                      random_numbers):
+        # runs until max_time or until the random numbers run out and returns the time, the number of random
+        # number rows used and the number of jumps made
+        no_al = al_sites.size
+        no_directions = offsets.shape[0]
+        no_jumps = 0
+        if no_al == 0:
+            return max_time, 0, no_jumps
+        for n in range(random_numbers.shape[0]):
+            time += -np.log(1.0 - random_numbers[n, 2]) / (jump_rate * no_directions * no_al)
+            if time > max_time:
+                return max_time, n, no_jumps
+            k = int(random_numbers[n, 0] * no_al)
+            jump_from = al_sites[k]
+            jump_to = neighbor_site(jump_from, int(random_numbers[n, 1] * no_directions), cells, periodic, scale,
+                                    basis, offsets, basis_lookup)
+            if jump_to < 0 or keys[find_slot(keys, jump_to)] == jump_to:
+                continue
+            remove_key(keys, jump_from)
+            keys[find_slot(keys, jump_to)] = jump_to
+            al_sites[k] = jump_to
+            no_jumps += 1
+        return time, random_numbers.shape[0], no_jumps
+
+    @jit
+    def count_bonds(al_sites, keys, cells, periodic, scale, basis, offsets, basis_lookup):
+        # number of Al-Cu bonds
+        no_bonds = 0
+        for k in range(al_sites.size):
+            for direction in range(offsets.shape[0]):
+                neighbor = neighbor_site(al_sites[k], direction, cells, periodic, scale, basis, offsets, basis_lookup)
+                if neighbor >= 0 and keys[find_slot(keys, neighbor)] != neighbor:
+                    no_bonds += 1
+        return no_bonds
+
+    @jit
+    def insert_keys(keys, sites):
+        for site in sites:
+            keys[find_slot(keys, site)] = site
+
+    return solute_kernel, count_bonds, insert_keys
+
+
+solute_python, count_bonds_python, insert_keys_python = _build_kernels(lambda function: function)
+solute_numba, count_bonds_numba, insert_keys_numba = _build_kernels(njit) if HAVE_NUMBA else (None, None, None)
+
+
+def get_kernels(backend='numba'):
+    return select_kernels((solute_python, count_bonds_python, insert_keys_python),
+                          (solute_numba, count_bonds_numba, insert_keys_numba), backend)
+
+
+def get_geometry(kind, shape, periodic=False):
+    # what the kernels need to compute neighbors, the same numbering as lattice.build_lattice
+    if kind not in lattice_kinds:
+        raise ValueError(f'Unknown lattice: {kind}')
+    scale, basis, offsets = lattice_kinds[kind]
+    cells = get_cells(kind, shape)
+    dimension = len(cells)
+    basis_lookup = np.full(scale**dimension, -1, dtype=np.int64)
+    for b, site in enumerate(basis):
+        # remainders are raveled with the last axis fastest, like the kernel does
+        basis_lookup[np.ravel_multi_index(site, (scale,) * dimension)] = b
+    return {'kind': kind, 'shape': tuple(shape), 'cells': np.array(cells, dtype=np.int64),
+            'periodic': np.array(get_periodic(periodic, dimension)), 'scale': scale,
+            'basis': np.array(basis, dtype=np.int64), 'offsets': np.array(offsets, dtype=np.int64),
+            'basis_lookup': basis_lookup}
+
+
+def get_geometry_arguments(state):
+    return (state['cells'], state['periodic'], state['scale'], state['basis'], state['offsets'], state['basis_lookup'])
+
+
+def make_solute_state(al_sites, kind, shape, periodic=False):
+    # the hash set is at most half full, the Al count never changes so it never grows
+    al_sites = np.asarray(al_sites, dtype=np.int64)
+    if np.unique(al_sites).size != al_sites.size:
+        raise ValueError('Al sites must be distinct.')
+    state = get_geometry(kind, shape, periodic)
+    keys = np.full(1 << max(int(2 * al_sites.size - 1).bit_length(), 1), -1, dtype=np.int64)
+    get_kernels(cu_thin_film.jump_backend)[2](keys, al_sites)
+    state.update({'al_sites': al_sites, 'keys': keys, 'no_sites': int(np.prod(shape))})
+    return state
+
+
+def generate_al_sites(percent_aluminum, shape):
+    # the sites generate_cu_al_grid would make Al, drawn a few rows at a time without the full lattice
+    row_size = int(np.prod(shape[1:]))
+    al_sites = []
+    for first_row in range(0, shape[0] // 2, generation_rows):
+        no_rows = min(generation_rows, shape[0] // 2 - first_row)
+        al_sites.append(np.flatnonzero(stream.uniforms(no_rows * row_size) < percent_aluminum) + first_row * row_size)
+    return np.concatenate(al_sites) if al_sites else np.empty(0, dtype=np.int64)
+
+
+def get_types(state):
+    # the dense species array, only for lattices that fit in memory
+    types = np.zeros(state['no_sites'], dtype=np.int8)
+    types[state['al_sites']] = 1
+    return types.reshape(state['shape'])
+
+
+def get_al_per_row(state):
+    return np.bincount(state['al_sites'] // (state['no_sites'] // state['shape'][0]), minlength=state['shape'][0])
+
+
+def get_bond_count(state):
+    count_bonds = get_kernels(cu_thin_film.jump_backend)[1]
+    return count_bonds(state['al_sites'], state['keys'], *get_geometry_arguments(state))
+
+
+def solute_step(state, current_time, temperature, tau):
+    solute_kernel = get_kernels(cu_thin_film.jump_backend)[0]
+    jump_rate = cu_thin_film.diffusion_coefficient_cu(temperature) / cu_thin_film.distance**2
+    if telemetry.enabled:
+        start = telemetry.clock()
+    step_time = 0.0
+    no_jumps = 0
+    while True:
+        random_numbers = stream.uniforms((random_number_block, 3))
+        step_time, no_used, no_block_jumps = solute_kernel(state['al_sites'], state['keys'], *get_geometry_arguments(state),
+                                                           jump_rate, step_time, tau, random_numbers)
+        no_jumps += no_block_jumps
+        if no_used < random_number_block:
+            break
+    current_time += tau
+    temperature = cu_thin_film.initial_temperature + ((cu_thin_film.end_temperature - cu_thin_film.initial_temperature)
+                                                      * current_time / cu_thin_film.total_time)
+    if telemetry.enabled:
+        telemetry.add_time('kernel', start)
+        telemetry.count('events', no_jumps)
+        telemetry.count('steps')
+        telemetry.maybe_emit(time=current_time, temperature=temperature, jumps=no_jumps)
+    return current_time, temperature, no_jumps
+
+
+def run_simulation():
+    run_seed = cu_thin_film.seed if cu_thin_film.seed is not None else np.random.SeedSequence().entropy
+    seed_stream(run_seed)
+    shape = cu_thin_film.get_lattice_shape()
+    state = make_solute_state(generate_al_sites(cu_thin_film.al_concentration, shape), cu_thin_film.lattice_kind,
+                              shape, cu_thin_film.periodic)
+    current_time = 0.0
+    temperature = cu_thin_film.initial_temperature
+    observables = TimeSeries()
+    if cu_thin_film.telemetry_file:
+        telemetry.enable(cu_thin_film.telemetry_file, cu_thin_film.telemetry_interval)
+    while temperature < cu_thin_film.end_temperature:
+        current_time, temperature, no_jumps = solute_step(state, current_time, temperature, time_step)
+        observables.append(time=current_time, temperature=temperature, al_per_row=get_al_per_row(state),
+                           al_cu_bonds=get_bond_count(state))
+    observables.save(observables_file)
+    np.save(al_sites_file, state['al_sites'])
+    if telemetry.enabled:
+        telemetry.emit(time=current_time, temperature=temperature, finished=True)
+        telemetry.disable()
+    return state, current_time, temperature
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Solute only KMC of the thin film, memory scales with the Al atoms.')
+    parser.add_argument('--seed', type=int, help='seed of the run, a fresh one is drawn without it')
+    args = parser.parse_args()
+    if args.seed is not None:
+        cu_thin_film.seed = args.seed
+    run_simulation()
@@ -0,0 +1,67 @@
+import json
+import time as timer
+
+# counters, per phase timers and a JSON lines stream of periodic records for both engines. Nothing is measured
+# unless enable() was called: the engines guard every count and timer with `if telemetry.enabled`, a disabled
+# run pays one global lookup per phase. Counters and timers are cumulative since enable(), every record holds
+# all of them together with whatever the engine passes (time, temperature, jumps of the step, ...).
+
+enabled = False
+counters = {}
+timers = {}
+output = None
+record_interval = 1.0  # wall seconds between two records
+start_time = 0.0
+last_record_time = 0.0
+
+clock = timer.perf_counter
+
+
+def enable(filename=None, interval=1.0):
+    # records are appended to filename, without a file they are only returned by emit
+    global enabled, output, record_interval, start_time, last_record_time
+    disable()
+    counters.clear()
+    timers.clear()
+    output = open(filename, 'a') if filename else None
+    record_interval = interval
+    start_time = last_record_time = clock()
+    enabled = True
+
+
+def disable():
+    global enabled, output
+    if output is not None:
+        output.close()
+        output = None
+    enabled = False
+
+
+def count(name, amount=1):
+    counters[name] = counters.get(name, 0) + int(amount)
+
+
+def add_time(name, start):
+    # start is the clock() reading taken when the phase began
+    timers[name] = timers.get(name, 0.0) + clock() - start
+
+
+def emit(**values):
+    global last_record_time
+    last_record_time = clock()
+    record = dict(values, wall_time=last_record_time - start_time, counters=dict(counters), timers=dict(timers))
+    if output is not None:
+        output.write(json.dumps(record) + '\n')
+        output.flush()
+    return record
+
+
+def maybe_emit(**values):
+    if clock() - last_record_time >= record_interval:
+        return emit(**values)
+    return None
+
+
+def load_records(filename):
+    with open(filename) as f:
+        return [json.loads(line) for line in f if line.strip()]
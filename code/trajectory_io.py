@@ -0,0 +1,163 @@
+import json
+import os
+import re
+import struct
+import zlib
+
+import numpy as np
+
+# one append-only file per run:
+#   magic, uint32 header length, JSON header (shape, dtype, packing, compression, seed, constants)
+#   frames: float64 time, float64 temperature, uint32 payload length, payload
+# the payload is the species array, int8 or bit-packed (np.packbits), optionally zlib compressed.
+# Uncompressed frames all have the same size and are read through a memory map.
+
+magic = b'KMCTRJ01'
+frame_header = struct.Struct('<ddI')
+
+
+def get_payload_size(shape, packing):
+    no_sites = int(np.prod(shape))
+    return (no_sites + 7) // 8 if packing == 'bits' else no_sites
+
+
+def encode_frame(species, packing, compression):
+    species = np.ascontiguousarray(species, dtype=np.int8).ravel()
+    payload = np.packbits(species.astype(bool)).tobytes() if packing == 'bits' else species.tobytes()
+    if compression == 'zlib':
+        payload = zlib.compress(payload)
+    return payload
+
+
+def decode_frame(payload, shape, packing, compression):
+    if compression == 'zlib':
+        payload = zlib.decompress(payload)
+    data = np.frombuffer(payload, dtype=np.uint8)
+    no_sites = int(np.prod(shape))
+    if packing == 'bits':
+        return np.unpackbits(data, count=no_sites).astype(np.int8).reshape(shape)
+    return data.view(np.int8)[:no_sites].reshape(shape)
+
+
+def read_header(f):
+    if f.read(len(magic)) != magic:
+        raise ValueError(f'{f.name} is not a KMC trajectory file')
+    header_length, = struct.unpack('<I', f.read(4))
+    header = json.loads(f.read(header_length).decode())
+    header['shape'] = tuple(header['shape'])
+    return header, len(magic) + 4 + header_length
+
+
+class TrajectoryWriter:
+
+    def __init__(self, filename, shape, seed=None, constants=None, packing='bits', compression=None, append=False):
+        if packing not in ('bits', 'none'):
+            raise ValueError(f'Unknown packing: {packing}')
+        if compression not in (None, 'zlib'):
+            raise ValueError(f'Unknown compression: {compression}')
+        self.filename = filename
+        self.shape = tuple(shape)
+        self.packing = packing
+        self.compression = compression
+        if append and os.path.exists(filename) and os.path.getsize(filename) > 0:
+            # continue an existing run, it has to describe the same lattice
+            with open(filename, 'rb') as f:
+                header, _ = read_header(f)
+            if header['shape'] != self.shape or header['packing'] != packing or header['compression'] != compression:
+                raise ValueError(f'{filename} holds a trajectory with a different layout')
+            self.f = open(filename, 'ab')
+        else:
+            header = {'shape': list(self.shape), 'dtype': 'int8', 'packing': packing, 'compression': compression,
+                      'seed': seed, 'constants': constants or {}}
+            encoded_header = json.dumps(header).encode()
+            self.f = open(filename, 'wb')
+            self.f.write(magic + struct.pack('<I', len(encoded_header)) + encoded_header)
+
+    def write_frame(self, time, temperature, species):
+        if species.shape != self.shape:
+            raise ValueError(f'Frame of shape {species.shape} does not fit a trajectory of shape {self.shape}')
+        payload = encode_frame(species, self.packing, self.compression)
+        self.f.write(frame_header.pack(time, temperature, len(payload)) + payload)
+
+    def flush(self):
+        self.f.flush()
+
+    def close(self):
+        self.f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class TrajectoryReader:
+
+    def __init__(self, filename):
+        self.filename = filename
+        with open(filename, 'rb') as f:
+            self.header, self.data_offset = read_header(f)
+        self.shape = self.header['shape']
+        self.packing = self.header['packing']
+        self.compression = self.header['compression']
+        if self.compression is None:
+            payload_size = get_payload_size(self.shape, self.packing)
+            record_dtype = np.dtype([('time', '<f8'), ('temperature', '<f8'), ('length', '<u4'),
+                                     ('payload', 'u1', payload_size)])
+            # a frame that is still being written is left out
+            no_frames = (os.path.getsize(filename) - self.data_offset) // record_dtype.itemsize
+            if no_frames > 0:
+                self.frames = np.memmap(filename, dtype=record_dtype, mode='r', offset=self.data_offset, shape=(no_frames,))
+            else:
+                self.frames = np.zeros(0, dtype=record_dtype)
+            self.times = np.array(self.frames['time'])
+            self.temperatures = np.array(self.frames['temperature'])
+        else:
+            self.frames = None
+            self.offsets, self.lengths, self.times, self.temperatures = self.scan_frames()
+
+    def scan_frames(self):
+        # compressed frames differ in size, collect their offsets once
+        offsets, lengths, times, temperatures = [], [], [], []
+        file_size = os.path.getsize(self.filename)
+        with open(self.filename, 'rb') as f:
+            offset = self.data_offset
+            while offset + frame_header.size <= file_size:
+                f.seek(offset)
+                time, temperature, length = frame_header.unpack(f.read(frame_header.size))
+                if offset + frame_header.size + length > file_size:
+                    break
+                offsets.append(offset + frame_header.size)
+                lengths.append(length)
+                times.append(time)
+                temperatures.append(temperature)
+                offset += frame_header.size + length
+        return np.array(offsets, dtype=np.int64), np.array(lengths, dtype=np.int64), np.array(times), np.array(temperatures)
+
+    def __len__(self):
+        return len(self.times)
+
+    def __getitem__(self, index):
+        if self.frames is not None:
+            return decode_frame(self.frames[index]['payload'], self.shape, self.packing, None)
+        with open(self.filename, 'rb') as f:
+            f.seek(self.offsets[index])
+            payload = f.read(self.lengths[index])
+        return decode_frame(payload, self.shape, self.packing, self.compression)
+
+    def nearest_frame(self, time):
+        return int(np.abs(self.times - time).argmin())
+
+
+def convert_dump_directory(directory, filename, shape, packing='bits', compression=None):
+    # packs the float64 lattice_t_..._temp_....bin dumps of a directory into one trajectory file, sorted by time
+    dumps = []
+    for dump in os.listdir(directory):
+        match = re.fullmatch(r'lattice_t_([-\d.e+]+)_temp_([-\d.e+]+)\.bin', dump)
+        if match:
+            dumps.append((float(match.group(1)), float(match.group(2)), dump))
+    with TrajectoryWriter(filename, shape, packing=packing, compression=compression) as writer:
+        for time, temperature, dump in sorted(dumps):
+            writer.write_frame(time, temperature, np.fromfile(os.path.join(directory, dump)).reshape(shape))
+    return len(dumps)
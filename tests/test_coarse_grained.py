@@ -0,0 +1,45 @@
+import numpy as np
+
+import coarse_grained
+from fenwick_tree import build_fenwick_tree
+from rng import seed_stream
+
+
+def assert_matches_rebuild(array):
+    possible_jumps = coarse_grained.get_possible_jumps(array['Al'], array['Cu'])
+    assert np.array_equal(array['possible_jumps'], possible_jumps)
+    assert np.array_equal(array['jump_tree'], build_fenwick_tree(possible_jumps))
+    assert array['total_possible_jumps'] == possible_jumps.sum()
+
+
+def count_calls(calls, name, function):
+    def counted(*args):
+        calls[name] += 1
+        return function(*args)
+    return counted
+
+
+def test_adaptive_leaps_conserve_atoms(monkeypatch):
+    calls = {'split_boxes': 0, 'merge_boxes': 0}
+    for name in calls:
+        monkeypatch.setattr(coarse_grained, name, count_calls(calls, name, getattr(coarse_grained, name)))
+    seed_stream(4)
+    array = coarse_grained.make_adaptive_array(coarse_grained.al_concentration, coarse_grained.N)
+    no_al, no_cu = array['Al'].sum(), array['Cu'].sum()
+    total_width = coarse_grained.N * 2**coarse_grained.adaptive_levels
+    time = 0.0
+    for step in range(1, 601):
+        array, time, _ = coarse_grained.coarse_grained_tau_leap(array, coarse_grained.get_jump_site_array(array), time,
+                                                                1e300, 700, coarse_grained.get_unit_length())
+        if step % coarse_grained.adapt_interval == 0:
+            array = coarse_grained.adapt_boxes(array)
+        assert array['Al'].sum() == no_al
+        assert array['Cu'].sum() == no_cu
+        assert array['width'].sum() == total_width
+        assert (array['Al'] >= 0).all() and (array['Cu'] >= 0).all()
+        assert_matches_rebuild(array)
+    # the boxes are halved and merged again as the front moves, widths stay powers of two on their grid
+    assert calls['split_boxes'] > 1 and calls['merge_boxes'] > 1
+    width = array['width']
+    assert (width & (width - 1) == 0).all()
+    assert ((np.cumsum(width) - width) % width == 0).all()
@@ -0,0 +1,37 @@
+import numpy as np
+
+from fenwick_tree import build_fenwick_tree, fenwick_prefix_sum, fenwick_search, fenwick_total, fenwick_update
+
+
+def test_build_matches_updates_and_prefix_sums():
+    rng = np.random.default_rng(2)
+    for size in (1, 2, 3, 7, 8, 100):
+        weights = rng.integers(0, 5, size)
+        tree = build_fenwick_tree(weights)
+        updated = np.zeros(size, dtype=weights.dtype)
+        for index, weight in enumerate(weights):
+            fenwick_update(updated, index, weight)
+        assert np.array_equal(tree, updated)
+        cumulative = np.cumsum(weights)
+        assert [fenwick_prefix_sum(tree, index) for index in range(size)] == cumulative.tolist()
+        assert fenwick_total(tree) == weights.sum()
+
+
+def test_search_matches_searchsorted():
+    rng = np.random.default_rng(3)
+    # zero weights must never be picked
+    weights = rng.integers(0, 4, 257)
+    tree = build_fenwick_tree(weights)
+    cumulative = np.cumsum(weights)
+    for value in range(int(weights.sum())):
+        index = fenwick_search(tree, value)
+        assert index == np.searchsorted(cumulative, value, side='right')
+        assert weights[index] > 0
+    # after updates as well
+    for index in rng.integers(0, weights.size, 50):
+        delta = -int(weights[index]) if rng.uniform() < 0.5 else 2
+        weights[index] += delta
+        fenwick_update(tree, index, delta)
+    cumulative = np.cumsum(weights)
+    for value in rng.uniform(0, weights.sum(), 200):
+        assert fenwick_search(tree, value) == np.searchsorted(cumulative, value, side='right')
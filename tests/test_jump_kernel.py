@@ -0,0 +1,94 @@
+import numpy as np
+import pytest
+
+import cu_thin_film
+import jump_kernel
+from fenwick_tree import build_fenwick_tree
+from lattice import count_unlike_neighbors
+from rng import seed_stream
+
+needs_numba = pytest.mark.skipif(not jump_kernel.HAVE_NUMBA, reason='numba is not installed')
+
+
+def run(monkeypatch, backend, kmc_mode, shape=(40, 6), no_calls=20):
+    monkeypatch.setattr(cu_thin_film, 'jump_backend', backend)
+    monkeypatch.setattr(cu_thin_film, 'initial_temperature', 700)
+    seed_stream(5)
+    atom_jump_site_matrix, jump_site_list = cu_thin_film.get_atom_jump_site_matrix(cu_thin_film.generate_cu_al_grid(0.3, shape))
+    time, temperature = 0.0, 700
+    for _ in range(no_calls):
+        if kmc_mode == 'rejection_free':
+            time, temperature, atom_jump_site_matrix, jump_site_list = cu_thin_film.kmc_sim_rejection_free(
+                time, 1e300, temperature, 700, atom_jump_site_matrix, jump_site_list, 100)
+        else:
+            atom_jump_site_matrix, jump_site_list = cu_thin_film.make_jumps(atom_jump_site_matrix, jump_site_list, 100)
+    return atom_jump_site_matrix, jump_site_list, time
+
+
+def assert_matches_recount(atom_jump_site_matrix, jump_site_list):
+    # the counts, their total, the jump site set and the rate tree against counting from scratch
+    lattice = cu_thin_film.get_lattice(atom_jump_site_matrix['shape'])
+    counts = count_unlike_neighbors(atom_jump_site_matrix['type'], lattice)
+    assert np.array_equal(atom_jump_site_matrix['no_possible_jump_sites'], counts)
+    assert atom_jump_site_matrix['no_possible_jump_sites_total'][0] == counts.sum()
+    assert set(jump_site_list) == set(np.flatnonzero(counts).tolist())
+    assert np.array_equal(jump_site_list.position[jump_site_list.sites[:len(jump_site_list)]], np.arange(len(jump_site_list)))
+    if 'rate_tree' in atom_jump_site_matrix:
+        assert np.array_equal(atom_jump_site_matrix['rate_tree'], build_fenwick_tree(counts.astype(np.int64)))
+
+
+@pytest.mark.parametrize('kmc_mode', ['rejection_free', 'step'])
+def test_python_kernels_match_recount(monkeypatch, kmc_mode):
+    atom_jump_site_matrix, jump_site_list, _ = run(monkeypatch, 'python', kmc_mode)
+    assert_matches_recount(atom_jump_site_matrix, jump_site_list)
+
+
+@needs_numba
+@pytest.mark.parametrize('kmc_mode', ['rejection_free', 'step'])
+def test_numba_matches_python(monkeypatch, kmc_mode):
+    python_matrix, python_list, python_time = run(monkeypatch, 'python', kmc_mode)
+    numba_matrix, numba_list, numba_time = run(monkeypatch, 'numba', kmc_mode)
+    assert_matches_recount(numba_matrix, numba_list)
+    assert numba_time == python_time
+    assert np.array_equal(numba_matrix['type'], python_matrix['type'])
+    assert np.array_equal(numba_list.sites[:len(numba_list)], python_list.sites[:len(python_list)])
+    if kmc_mode == 'rejection_free':
+        assert np.array_equal(numba_matrix['rate_tree'], python_matrix['rate_tree'])
+
+
+def test_batch_jumps_match_recount(monkeypatch):
+    seed_stream(6)
+    atom_jump_site_matrix, jump_site_list = cu_thin_film.get_atom_jump_site_matrix(cu_thin_film.generate_cu_al_grid(0.3, (60, 30)))
+    types = atom_jump_site_matrix['type']
+    lattice = cu_thin_film.get_lattice(atom_jump_site_matrix['shape'])
+    neighbor_start, neighbors = lattice['neighbor_start'], lattice['neighbors']
+    no_al = types.sum()
+    previous = types.copy()
+    round_sizes = []
+    recount_sites = cu_thin_film.recount_sites
+
+    def check_round(atom_jump_site_matrix, jump_site_list, sites):
+        # the sites a round swapped each have exactly one swapped neighbor when the regions are disjoint,
+        # the region of a jump is both sites and all their neighbors
+        swapped = np.flatnonzero(types != previous)
+        swapped_set = set(swapped.tolist())
+        regions = []
+        for site in swapped:
+            partners = [neighbor for neighbor in neighbors[neighbor_start[site]:neighbor_start[site + 1]] if neighbor in swapped_set]
+            assert len(partners) == 1
+            if site < partners[0]:
+                region = {site, partners[0]}
+                for end in (site, partners[0]):
+                    region.update(neighbors[neighbor_start[end]:neighbor_start[end + 1]].tolist())
+                regions.append(region)
+        assert sum(len(region) for region in regions) == len(set().union(*regions))
+        round_sizes.append(len(regions))
+        recount_sites(atom_jump_site_matrix, jump_site_list, sites)
+        previous[:] = types
+
+    monkeypatch.setattr(cu_thin_film, 'recount_sites', check_round)
+    for _ in range(10):
+        atom_jump_site_matrix, jump_site_list = cu_thin_film.make_jumps_batch(atom_jump_site_matrix, jump_site_list, 100)
+    assert max(round_sizes) > 1
+    assert types.sum() == no_al
+    assert_matches_recount(atom_jump_site_matrix, jump_site_list)
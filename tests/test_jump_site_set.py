@@ -0,0 +1,40 @@
+import numpy as np
+
+from jump_site_set import JumpSiteSet
+
+
+def assert_consistent(jump_site_set, expected):
+    members = jump_site_set.sites[:jump_site_set.size]
+    assert set(members.tolist()) == expected
+    assert len(members) == len(expected)
+    # every member sits in the slot position points to, every other site is -1
+    assert np.array_equal(jump_site_set.position[members], np.arange(jump_site_set.size))
+    outside = np.setdiff1d(np.arange(jump_site_set.position.size), members)
+    assert (jump_site_set.position[outside] == -1).all()
+
+
+def test_add_many_and_discard_many_match_a_set():
+    rng = np.random.default_rng(1)
+    n_sites = 200
+    jump_site_set = JumpSiteSet.from_sites(n_sites, rng.integers(0, n_sites, 80))
+    expected = set(jump_site_set)
+    for _ in range(300):
+        # duplicates, members and non-members mixed in every call
+        sites = rng.integers(0, n_sites, rng.integers(0, 40))
+        if rng.uniform() < 0.5:
+            jump_site_set.add_many(sites)
+            expected |= set(sites.tolist())
+        else:
+            jump_site_set.discard_many(sites)
+            expected -= set(sites.tolist())
+        assert_consistent(jump_site_set, expected)
+
+
+def test_discard_many_of_all_members_and_of_the_tail():
+    jump_site_set = JumpSiteSet.from_sites(10, np.arange(10))
+    jump_site_set.discard_many(np.array([9, 8, 0, 0]))
+    assert_consistent(jump_site_set, set(range(1, 8)))
+    jump_site_set.discard_many(np.arange(10))
+    assert_consistent(jump_site_set, set())
+    jump_site_set.add_many(np.array([3, 3, 5]))
+    assert_consistent(jump_site_set, {3, 5})
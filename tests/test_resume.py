@@ -0,0 +1,57 @@
+import os
+import shutil
+
+import numpy as np
+
+import coarse_grained
+import cu_thin_film
+
+
+def configure_thin_film(monkeypatch):
+    for name, value in {'grid_dim_y': 40, 'grid_dim_x': 4, 'al_concentration': 0.3, 'initial_temperature': 680,
+                        'end_temperature': 700, 'total_time': 0.05, 'observables_interval': 0.0005,
+                        'events_per_step': 10, 'checkpoint_interval': 7, 'record_events': True,
+                        'keyframe_interval': 100, 'seed': 11, 'telemetry_file': None, 'jump_backend': 'python'}.items():
+        monkeypatch.setattr(cu_thin_film, name, value)
+    os.makedirs('dump')
+
+
+def test_thin_film_resume_is_bit_identical(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    configure_thin_film(monkeypatch)
+    full = cu_thin_film.run_simulation()
+    assert os.path.exists(cu_thin_film.checkpoint_file)
+    outputs = [cu_thin_film.trajectory_file, cu_thin_film.event_log_file, cu_thin_film.observables_file]
+    for filename in outputs:
+        shutil.copy(filename, filename + '.full')
+
+    resumed = cu_thin_film.run_simulation(cu_thin_film.checkpoint_file)
+    assert (resumed[0], resumed[1]) == (full[0], full[1])
+    assert np.array_equal(resumed[2]['type'], full[2]['type'])
+    assert np.array_equal(resumed[2]['rate_tree'], full[2]['rate_tree'])
+    assert np.array_equal(resumed[3].sites[:len(resumed[3])], full[3].sites[:len(full[3])])
+    with open(cu_thin_film.trajectory_file, 'rb') as f, open(cu_thin_film.trajectory_file + '.full', 'rb') as g:
+        assert f.read() == g.read()
+    for filename in outputs[1:]:
+        with np.load(filename) as resumed_data, np.load(filename + '.full') as full_data:
+            assert resumed_data.files == full_data.files
+            assert all(np.array_equal(resumed_data[key], full_data[key]) for key in full_data.files)
+
+
+def test_coarse_resume_is_bit_identical(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    for name, value in {'coarse_mode': 'tau_leap', 'start_temperature': 600, 'end_temperature': 650,
+                        'checkpoint_interval': 70, 'seed': 3, 'telemetry_file': None}.items():
+        monkeypatch.setattr(coarse_grained, name, value)
+    os.makedirs('coarse_dump_02')
+    full = coarse_grained.run_simulation()
+    with np.load(coarse_grained.observables_file) as data:
+        full_observables = dict(data)
+
+    resumed = coarse_grained.run_simulation(coarse_grained.checkpoint_file)
+    assert (resumed[1], resumed[2]) == (full[1], full[2])
+    for key in ('Al', 'Cu', 'possible_jumps', 'jump_tree'):
+        assert np.array_equal(resumed[0][key], full[0][key])
+    with np.load(coarse_grained.observables_file) as data:
+        assert data.files == list(full_observables)
+        assert all(np.array_equal(data[key], full_observables[key]) for key in full_observables)